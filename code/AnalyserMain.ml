@@ -9,13 +9,14 @@ let is_saturated (nfa, y, p) =
   Phi.subset p2 p;;
 
 let enumerate_verbose nfa =
+  let budget = Budget.unlimited () in
   (* find all pumpable kleene and the corresponding branch points *)
   let ktbl = Util.find_pumpable_kleene nfa in
   (* form the set of pumpable kleene *)
   let kset = Hashtbl.fold (fun k _ s -> IntSet.add k s) ktbl IntSet.empty in
   (* function for searching z *)
   let search_z (lead, y2p) kont =
-    let zs = ZAnalyser.init (nfa, lead, y2p) in
+    let zs = ZAnalyser.init (nfa, lead, y2p) budget in
     let rec explore () = match ZAnalyser.next zs with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (z, zp) -> (
@@ -25,7 +26,7 @@ let enumerate_verbose nfa =
     explore () in
   (* function for searching y2 *)
   let search_y2 ik (lead, y1_tpl) xp kont =
-    let y2s = Y2Analyser.init (nfa, lead, y1_tpl) ik in
+    let y2s = Y2Analyser.init (nfa, lead, y1_tpl) ik budget in
     let rec explore () = match Y2Analyser.next y2s with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (y2, y2p) -> (
@@ -40,7 +41,7 @@ let enumerate_verbose nfa =
     explore () in
   (* function for searching y1 *)
   let search_y1 ik (lead, xp) kont =
-    let y1s = Y1Analyser.init (nfa, lead, xp) (ik, (Hashtbl.find ktbl ik)) in
+    let y1s = Y1Analyser.init (nfa, lead, xp) (ik, (Hashtbl.find ktbl ik)) budget in
     let rec explore () = match Y1Analyser.next y1s with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (y1, y1_tpl) -> (
@@ -52,7 +53,7 @@ let enumerate_verbose nfa =
     explore () in
   (* function for searching x *)
   let search_x () =
-    let xs = XAnalyser.init nfa kset in
+    let xs = XAnalyser.init nfa kset budget in
     let rec explore () = match XAnalyser.next xs with
       |None -> Printf.printf "Done.\n%!"
       |Some (ik, x, xp) -> (
@@ -64,20 +65,21 @@ let enumerate_verbose nfa =
   if not (IntSet.is_empty kset) then search_x () else Printf.printf "Done.\n%!";;
 
 let search_exhaustive nfa =
+  let budget = Budget.unlimited () in
   (* find all pumpable kleene and the corresponding branch points *)
   let ktbl = Util.find_pumpable_kleene nfa in
   (* form the set of pumpable kleene *)
   let kset = Hashtbl.fold (fun k _ s -> IntSet.add k s) ktbl IntSet.empty in
   (* function for searching z *)
   let search_z (x, y, y2p) kont =
-    let zs = ZAnalyser.init (nfa, Word.append x y, y2p) in
+    let zs = ZAnalyser.init (nfa, Word.append x y, y2p) budget in
     let explore () = match ZAnalyser.next zs with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (z, _zp) -> Some (x, y, z) in
     explore () in
   (* function for searching y2 *)
   let search_y2 ik (x, y1, y1_tpl) xp kont =
-    let y2s = Y2Analyser.init (nfa, Word.append x y1, y1_tpl) ik in
+    let y2s = Y2Analyser.init (nfa, Word.append x y1, y1_tpl) ik budget in
     let rec explore () = match Y2Analyser.next y2s with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (y2, y2p) ->
@@ -90,7 +92,7 @@ let search_exhaustive nfa =
     explore () in
   (* function for searching y1 *)
   let search_y1 ik (x, xp) kont =
-    let y1s = Y1Analyser.init (nfa, x, xp) (ik, (Hashtbl.find ktbl ik)) in
+    let y1s = Y1Analyser.init (nfa, x, xp) (ik, (Hashtbl.find ktbl ik)) budget in
     let rec explore () = match Y1Analyser.next y1s with
       |None -> kont () (* exhausted, invoke continuation *)
       |Some (y1, y1_tpl) ->
@@ -99,7 +101,7 @@ let search_exhaustive nfa =
     explore () in
   (* function for searching x *)
   let search_x () =
-    let xs = XAnalyser.init nfa kset in
+    let xs = XAnalyser.init nfa kset budget in
     let rec explore () = match XAnalyser.next xs with
       |None -> None
       |Some (ik, x, xp) ->
@@ -109,27 +111,29 @@ let search_exhaustive nfa =
   if not (IntSet.is_empty kset) then search_x () else None;;
 
 (* eliminate obviously non-vulnerable kleene states *)
-let eliminate_non_vulnerable nfa kpumpable =
+let eliminate_non_vulnerable nfa kpumpable budget =
   IntSet.fold (fun ik s ->
     let p = Phi.make (IntSet.singleton ik) in
-    let zs = ZAnalyser.init (nfa, Word.empty, p) in
+    let zs = ZAnalyser.init (nfa, Word.empty, p) budget in
     match ZAnalyser.next zs with
       |None -> s 
       |Some _ -> IntSet.add ik s
   ) kpumpable IntSet.empty;;
 
-let search_optimized nfa slim =
+let search_phases nfa slim budget phases =
   (* find all pumpable kleene and the corresponding branch points *)
-  let ktbl = Util.find_pumpable_kleene nfa in
+  let ktbl = Phases.time phases "kleene" (fun () -> Util.find_pumpable_kleene nfa) in
   (* form the set of pumpable kleene *)
   let kpumpable = Hashtbl.fold (fun k _ s -> IntSet.add k s) ktbl IntSet.empty in
   (* filter out non-vulenrable kleene *)
-  let kanalyse = eliminate_non_vulnerable nfa kpumpable in
+  let kanalyse = Phases.time phases "eliminate" (fun () -> eliminate_non_vulnerable nfa kpumpable budget) in
   let flgs = ref Flags.empty in
+  (* the analysers give up silently once the budget is exhausted, the result may then be incomplete *)
+  let timed_out () = if Budget.is_exhausted budget then Flags.set_timeout !flgs else !flgs in
   (* function for searching z *)
   let search_z ik (x, y, y2p) kont =
-    let zs = ZAnalyser.init (nfa, Word.append x y, y2p) in
-    let explore () = match ZAnalyser.next zs with
+    let zs = ZAnalyser.init (nfa, Word.append x y, y2p) budget in
+    let explore () = match Phases.time phases "z" (fun () -> ZAnalyser.next zs) with
       |None -> 
         flgs := Flags.union (ZAnalyser.flags zs) !flgs;
         kont () (* exhausted, invoke continuation *)
@@ -137,17 +141,17 @@ let search_optimized nfa slim =
     explore () in
   (* function for searching y2 *)
   let search_y2 ik (x, y1, y1_tpl) xp kont =
-    let y2s = Y2Analyser.init (nfa, Word.append x y1, y1_tpl) ik in
+    let y2s = Y2Analyser.init (nfa, Word.append x y1, y1_tpl) ik budget in
     (* number of unstable derivations *)
     let sfails = ref 0 in
-    let rec explore () = match Y2Analyser.next y2s with
+    let rec explore () = match Phases.time phases "y2" (fun () -> Y2Analyser.next y2s) with
       |None ->
         flgs := Flags.union (Y2Analyser.flags y2s) !flgs;
         kont () (* exhausted, invoke continuation *)
       |Some (y2, y2p) ->
         let y = Word.append y1 y2 in
         (* check inclusion or extended inclusion *)
-        if (Phi.subset y2p xp || is_saturated (nfa, y, y2p)) then (
+        if Phases.time phases "y2" (fun () -> Phi.subset y2p xp || is_saturated (nfa, y, y2p)) then (
           (* stable derivation, reset counter *)
           sfails := 0;
           (* search z with a fallback to self *)
@@ -165,8 +169,8 @@ let search_optimized nfa slim =
     explore () in
   (* function for searching y1 *)
   let search_y1 ik (x, xp) kont =
-    let y1s = Y1Analyser.init (nfa, x, xp) (ik, (Hashtbl.find ktbl ik)) in
-    let rec explore () = match Y1Analyser.next y1s with
+    let y1s = Y1Analyser.init (nfa, x, xp) (ik, (Hashtbl.find ktbl ik)) budget in
+    let rec explore () = match Phases.time phases "y1" (fun () -> Y1Analyser.next y1s) with
       |None ->
         flgs := Flags.union (Y1Analyser.flags y1s) !flgs;
         kont () (* exhausted, invoke continuation *)
@@ -176,14 +180,40 @@ let search_optimized nfa slim =
     explore () in
   (* function for searching x *)
   let search_x () =
-    let xs = XAnalyser.init nfa kanalyse in
-    let rec explore () = match XAnalyser.next xs with
+    let xs = XAnalyser.init nfa kanalyse budget in
+    let rec explore () = match Phases.time phases "x" (fun () -> XAnalyser.next xs) with
       |None ->
         flgs := Flags.union (XAnalyser.flags xs) !flgs;
-        (* completed, no attack strings found *)
-        (!flgs, kpumpable, None) 
+        (* completed (or out of budget), no attack strings found *)
+        (timed_out (), kpumpable, None)
       |Some (ik, x, xp) ->
         (* search y1 with a fallback to self *)
         search_y1 ik (x, xp) explore in
     explore () in
-  if not (IntSet.is_empty kanalyse) then search_x () else (!flgs, kpumpable, None);;
+  if not (IntSet.is_empty kanalyse) then search_x () else (timed_out (), kpumpable, None);;
+
+(* results of earlier searches keyed on the digest of the canonical NFA form and the search limit, the kleene states
+   are recorded by their canonical numbers so that they can be mapped onto any NFA of the same form *)
+let memo : (Digest.t * int, Flags.t * IntSet.t * (int * Word.t * Word.t * Word.t) option) Lru.t = Lru.create 4096;;
+
+let search_timed nfa slim budget phases =
+  let (form, number, state) = Phases.time phases "canonical" (fun () -> Nfa.canonical nfa) in
+  let key = (Digest.string form, slim) in
+  match Lru.find memo key with
+    |Some (f, kset, r) ->
+      (* the attack words carry over, only the kleene states are re-mapped *)
+      let r = match r with
+        |None -> None
+        |Some (ik, x, y, z) -> Some (state.(ik), x, y, z) in
+      (f, IntSet.map (fun k -> state.(k)) kset, r)
+    |None ->
+      let (f, kset, r) = search_phases nfa slim budget phases in
+      let canonical_kset = IntSet.map (fun k -> number.(k)) kset in
+      let canonical_r = match r with
+        |None -> None
+        |Some (ik, x, y, z) -> Some (number.(ik), x, y, z) in
+      (* an incomplete search depends on the budget, it is not recorded *)
+      if not (Flags.is_timeout f || IntSet.mem (-1) canonical_kset) then Lru.add memo key (f, canonical_kset, canonical_r);
+      (f, kset, r);;
+
+let search_optimized nfa slim budget = search_timed nfa slim budget (Phases.create ());;
@@ -8,5 +8,9 @@ val enumerate_verbose : Nfa.t -> unit;;
 (* normal exhaustive search for an attack string *)
 val search_exhaustive : Nfa.t -> (Word.t * Word.t * Word.t) option;;
 
-(* optimized search with pruning *)
-val search_optimized : Nfa.t -> int -> Flags.t * IntSet.t * (int * Word.t * Word.t * Word.t) option;;
+(* optimized search with pruning, within the given budget (Flags.timeout is set if it runs out); results are memoized
+   on the canonical form of the NFA (see Nfa.canonical), so patterns compiling to the same automaton are searched once *)
+val search_optimized : Nfa.t -> int -> Budget.t -> Flags.t * IntSet.t * (int * Word.t * Word.t * Word.t) option;;
+
+(* same as search_optimized, adding the time spent in each phase (canonical, kleene, eliminate, x, y1, y2, z) to the given phases *)
+val search_timed : Nfa.t -> int -> Budget.t -> Phases.t -> Flags.t * IntSet.t * (int * Word.t * Word.t * Word.t) option;;
@@ -3,18 +3,40 @@
 open Common
 open Nfa
 
-(* each beta is represented by a simple (reversed) list of states *)
-type t = int list;;
+(* each beta is represented by a simple (reversed) list of states, hash-consed with a unique id *)
+type t = {id : int; states : int list};;
+
+(* the interned betas, entries go away once the betas are no longer referenced *)
+module Interned = Weak.Make (
+  struct
+    type nonrec t = t;;
+    let equal b1 b2 = b1.states = b2.states;;
+    let hash b = Hashtbl.hash_param 256 256 b.states;;
+  end);;
+
+let interned = Interned.create 4096;;
+let next_id = ref 0;;
+
+(* the unique beta with the given states *)
+let intern l =
+  let b = {id = !next_id; states = l} in
+  let c = Interned.merge interned b in
+  if c == b then next_id := !next_id + 1;
+  c;;
 
 module BetaSet = Set.Make (
   struct
-    type t = int list;;
-    let compare = Stdlib.compare;;
+    type nonrec t = t;;
+    let compare b1 b2 = Stdlib.compare b1.id b2.id;;
   end);;
 
-let make i = [i];;
+let make i = intern [i];;
+
+let id b = b.id;;
+
+let to_list b = List.rev b.states;;
 
-let elems b = List.fold_left (fun s i -> IntSet.add i s) IntSet.empty b;;
+let elems b = List.fold_left (fun s i -> IntSet.add i s) IntSet.empty b.states;;
 
 (* sorted tree of betas *)
 type otree = OTNull | OTNode of char * char * int list * otree * otree;;
@@ -45,14 +67,14 @@ let rec otr_collect tr w lst = match tr with
     *)
     let (_, b) = List.fold_right (fun i (s, b) -> if IntSet.mem i s then (s, b) else (IntSet.add i s, i :: b)) l (IntSet.empty, []) in
     (* package the resulting beta along with its prefix *)
-    otr_collect rtr w (otr_collect ltr w ((Word.extend w (u, v), b) :: lst));;
+    otr_collect rtr w (otr_collect ltr w ((Word.extend w (u, v), intern b) :: lst));;
 
 let advance (nfa, w, b) =
   (*
     - we must fold right, since the beta is stored in reverse
     - otr_add pushes new betas in front of old ones, respecting the reverse order
   *)
-  let tr = List.fold_right (fun i tr -> List.fold_left (fun tr (u, v, j) -> otr_add tr u v [j]) tr (Nfa.get_transitions nfa i)) b OTNull in
+  let tr = List.fold_right (fun i tr -> List.fold_left (fun tr (u, v, j) -> otr_add tr u v [j]) tr (Nfa.get_transitions nfa i)) b.states OTNull in
   otr_collect tr w [];;
 
 let evolve (nfa, w, b) kset =
@@ -60,9 +82,11 @@ let evolve (nfa, w, b) kset =
   (*
     - consume all epsilon moves, no duplicates allowed in the result
     - notice that the final evolved beta comes out in reverse order (as desired)
+    - the walk is done state by state (rather than with Nfa.get_closure) since predicate continuations must be
+      expanded in place with one visited set, otherwise the priority order of the beta changes
   *)
   let rec evolve rb st eb hits = match rb with
-    |[] -> (!flgs, eb, hits)
+    |[] -> (!flgs, intern eb, hits)
     |i :: t when IntSet.mem i st -> evolve t st eb hits (* already explored the left-most occurence, ignore *)
     |i :: t ->
       let st = IntSet.add i st in
@@ -92,11 +116,11 @@ let evolve (nfa, w, b) kset =
         |BranchAlt (j, k) -> evolve (j :: k :: t) st eb hits
         |BranchKln (gd, j, k) ->
           (* record kleene hits, along with the corresponding left-beta *)
-          let hits = if IntSet.mem i kset then (i, (i :: eb)) :: hits else hits in
+          let hits = if IntSet.mem i kset then (i, intern (i :: eb)) :: hits else hits in
           (* ordering implied by the quantifier must be taken into account when evolving a beta *)
           if gd then
             evolve (j :: k :: t) st eb hits
           else
             evolve (k :: j :: t) st eb hits in
   (* must reverse beta in order to be able to pattern match *)
-  evolve (List.rev b) IntSet.empty [] [];;
+  evolve (List.rev b.states) IntSet.empty [] [];;
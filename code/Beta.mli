@@ -2,7 +2,7 @@
 
 open Common
 
-(* internal representation of beta *)
+(* internal representation of beta - hash-consed *)
 type t;;
 
 module BetaSet : (Set.S with type elt = t);;
@@ -10,6 +10,12 @@ module BetaSet : (Set.S with type elt = t);;
 (* beta with just one state *)
 val make : int -> t;;
 
+(* unique id of a beta, equal betas have the same id as long as one of them is alive *)
+val id : t -> int;;
+
+(* returns the states of this beta in priority order (left-most first) *)
+val to_list : t -> int list;;
+
 (* returns the set of states contained within this beta *)
 val elems : t -> IntSet.t;;
 
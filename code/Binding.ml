@@ -0,0 +1,37 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* entry point of the shared object used by the python binding (rxxr.py), see rxxr_stubs.c *)
+
+(* analysis status codes, mirrored in rxxr_stubs.c and rxxr.py *)
+let status_safe = 0;;
+let status_pumpable = 1;;
+let status_vulnerable = 2;;
+let status_error = 3;;
+
+(* raw bytes of a candidate string selected from the word *)
+let select w =
+  let b = Buffer.create (Word.length w) in
+  List.iter (Buffer.add_char b) (Word.select w [('\x21', '\x7e')]);
+  Buffer.contents b;;
+
+(* parse, compile and analyse a pattern of the form [/]REGEX[/MODS] within secs seconds (no limit if not
+   positive), returns the tuple (status, flags, kleene start, kleene end, prefix, pumpable, suffix, error) *)
+let analyse r slim secs =
+  let lexbuf = Lexing.from_string (r ^ "\n") in
+  try
+    let p = ParsingMain.parse_pattern lexbuf in
+    let nfa = Nfa.make p in
+    match AnalyserMain.search_optimized nfa slim (Budget.make secs 0) with
+      |(f, kset, None) ->
+        let status = if Common.IntSet.is_empty kset then status_safe else status_pumpable in
+        (status, Flags.to_int f, -1, -1, "", "", "", "")
+      |(f, _, Some (ik, x, y, z)) ->
+        let (i, j) = Nfa.get_subexp_location nfa ik in
+        (status_vulnerable, Flags.to_int f, i, j, select x, select y, select z, "")
+  with
+    |ParsingData.InvalidBackreference e ->
+      (status_error, 0, -1, -1, "", "", "", Printf.sprintf "invalid backreference \\%i" e)
+    |e ->
+      (status_error, 0, -1, -1, "", "", "", Printexc.to_string e);;
+
+let _ = Callback.register "rxxr_analyse" analyse;;
@@ -0,0 +1,38 @@
+(* © Copyright University of Birmingham, UK *)
+
+type t = {
+  (* absolute wall-clock deadline *)
+  deadline : float;
+  (* maximum number of steps *)
+  limit : int;
+  (* steps consumed so far *)
+  mutable steps : int;
+  (* once exhausted, always exhausted *)
+  mutable exhausted : bool
+};;
+
+(* the clock is only read once every this many steps (must be a power of two) *)
+let clock_period = 256;;
+
+let make secs limit = {
+  deadline = if secs > 0.0 then Unix.gettimeofday () +. secs else infinity;
+  limit = if limit > 0 then limit else max_int;
+  steps = 0;
+  exhausted = false
+};;
+
+let unlimited () = make 0.0 0;;
+
+let tick b =
+  if not b.exhausted then (
+    b.steps <- b.steps + 1;
+    if b.steps >= b.limit then
+      b.exhausted <- true
+    else if b.steps land (clock_period - 1) = 0 && b.deadline < infinity && Unix.gettimeofday () > b.deadline then
+      b.exhausted <- true
+  );
+  b.exhausted;;
+
+let is_exhausted b = b.exhausted;;
+
+let steps b = b.steps;;
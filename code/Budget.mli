@@ -0,0 +1,19 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* internal representation of an analysis budget *)
+type t;;
+
+(* budget of the specified wall-clock time (seconds) and number of analyser steps, non-positive values mean no limit *)
+val make : float -> int -> t;;
+
+(* budget without any limits *)
+val unlimited : unit -> t;;
+
+(* consume one analyser step, true if the budget is (or was already) exhausted *)
+val tick : t -> bool;;
+
+(* check for exhaustion without consuming a step *)
+val is_exhausted : t -> bool;;
+
+(* number of steps consumed so far *)
+val steps : t -> int;;
@@ -10,6 +10,7 @@ val accepting : t;; (* accpeting state found *)
 val klnhit : t;; (* kleene found *)
 val eoihit : t;; (* end of input anchor found *)
 val pruned : t;; (* analysis pruned *)
+val timeout : t;; (* analysis budget exhausted *)
 
 (* functions for querying flags *)
 val is_empty : t -> bool;;
@@ -18,6 +19,7 @@ val is_accepting : t -> bool;;
 val is_klnhit : t -> bool;;
 val is_eoihit : t -> bool;;
 val is_pruned : t -> bool;;
+val is_timeout : t -> bool;;
 
 (* functions for setting flags *)
 val set_interrupted : t -> t;;
@@ -25,6 +27,10 @@ val set_accepting : t -> t;;
 val set_klnhit : t -> t;;
 val set_eoihit : t -> t;;
 val set_pruned : t -> t;;
+val set_timeout : t -> t;;
 
 (* flag union *)
 val union : t -> t -> t;;
+
+(* integer representation (bit-mask) of the flags *)
+val to_int : t -> int;;
@@ -9,13 +9,107 @@ let cors_headers =
     Header.add (Header.init ()) "Access-Control-Allow-Origin" "*"
   ) "Access-Control-Allow-Method" "POST"
 
-let check_regex r =
-  print_endline(Basic.to_string(`String r)) ;
+(* pruning limit of the analysis *)
+let slim = 100
+
+let env_int name default =
+  try Sys.getenv name |> int_of_string
+  with Not_found | Failure _ -> default
+
+(* results keyed on (regex, slim), CACHE_FILE (optional) keeps them across restarts *)
+let cache : (string * int, Basic.t) Lru.t = Lru.create (env_int "CACHE_SIZE" 10000)
+let cache_file = try Some (Sys.getenv "CACHE_FILE") with Not_found -> None
+
+(* seconds between two snapshots of the cache (0 disables them, it is still saved on exit) *)
+let snapshot_secs = env_int "CACHE_SNAPSHOT_SECS" 300
+
+(* whether results were added since the last snapshot *)
+let cache_dirty = ref false
+
+(* snapshot format: the magic string, the number of entries, then per entry (least recently used first) the
+   regex, slim and compact JSON result, strings prefixed with their length; integers are 32-bit big-endian *)
+let snapshot_magic = "RXXRSNAP1\n"
+
+let load_cache fname =
+  try
+    let fd = Unix.openfile fname [Unix.O_RDONLY] 0 in
+    let data =
+      try Bigarray.array1_of_genarray (Unix.map_file fd Bigarray.char Bigarray.c_layout false [| -1 |])
+      with e -> Unix.close fd ; raise e in
+    Unix.close fd ;
+    let pos = ref 0 in
+    let read_string n =
+      let s = String.init n (fun i -> Bigarray.Array1.get data (!pos + i)) in
+      pos := !pos + n ;
+      s in
+    let read_int () =
+      let s = read_string 4 in
+      Int32.to_int (String.get_int32_be s 0) in
+    if read_string (String.length snapshot_magic) <> snapshot_magic then failwith "not a cache snapshot" ;
+    let n = read_int () in
+    for _i = 1 to n do
+      let r = read_string (read_int ()) in
+      let slim = read_int () in
+      let result = Basic.from_string (read_string (read_int ())) in
+      Lru.add cache (r, slim) result
+    done ;
+    Printf.printf "Loaded %d cached results from %s\n%!" (Lru.length cache) fname
+  with e ->
+    Printf.printf "Could not load the cache from %s: %s\n%!" fname (Printexc.to_string e)
+
+(* written to a temporary file first so that a crash never leaves a truncated cache behind *)
+let save_cache fname =
+  try
+    let entries = Lru.to_list cache in
+    let buf = Buffer.create (256 * List.length entries) in
+    let add_string s =
+      Buffer.add_int32_be buf (Int32.of_int (String.length s)) ;
+      Buffer.add_string buf s in
+    Buffer.add_string buf snapshot_magic ;
+    Buffer.add_int32_be buf (Int32.of_int (List.length entries)) ;
+    List.iter (fun ((r, slim), result) ->
+      add_string r ;
+      Buffer.add_int32_be buf (Int32.of_int slim) ;
+      add_string (Basic.to_string result)
+    ) entries ;
+    let tmp = fname ^ ".tmp" in
+    let fd = Unix.openfile tmp [Unix.O_WRONLY; Unix.O_CREAT; Unix.O_TRUNC] 0o644 in
+    (try
+       let _ = Unix.write_substring fd (Buffer.contents buf) 0 (Buffer.length buf) in
+       Unix.fsync fd
+     with e -> Unix.close fd ; raise e) ;
+    Unix.close fd ;
+    Sys.rename tmp fname ;
+    cache_dirty := false
+  with e ->
+    Printf.printf "Could not save the cache to %s: %s\n%!" fname (Printexc.to_string e)
+
+let rec snapshot_loop fname =
+  Lwt_unix.sleep (float_of_int snapshot_secs) >>= fun () ->
+  if !cache_dirty then save_cache fname ;
+  snapshot_loop fname
+
+let error_result r msg =
+  `Assoc [
+    ("input", `String r);
+    ("result", `String "error");
+    ("error", `String msg)
+  ]
+
+(* the lexers and parsers are interleaved (the pattern lexer parses the inner regex), so the "parse" phase
+   covers lexing as well *)
+let analyse_phases r secs phases size : Basic.t =
   let lexbuf =  Lexing.from_string (r ^ "\n") in
   try
-    let p = ParsingMain.parse_pattern lexbuf in
-    let nfa = Nfa.make p in
-    match AnalyserMain.search_optimized nfa 100 with
+    let p = Phases.time phases "parse" (fun () -> ParsingMain.parse_pattern lexbuf) in
+    let nfa = Phases.time phases "nfa" (fun () -> Nfa.make p) in
+    size := Nfa.size nfa ;
+    match AnalyserMain.search_timed nfa slim (Budget.make secs 0) phases with
+      |(f, _, None) when Flags.is_timeout f ->
+          `Assoc [
+            ("input", `String r);
+            ("result", `String "timeout")
+          ]
       |(_f, _, None) ->
           `Assoc [
             ("input", `String r);
@@ -32,51 +126,489 @@ let check_regex r =
           ]
   with
   | ParsingData.InvalidBackreference e ->
-    `Assoc [
-      ("input", `String r);
-      ("result", `String "error");
-      ("error", `String (Printf.sprintf "invalid backreference \\%i" e))
-    ]
+    error_result r (Printf.sprintf "invalid backreference \\%i" e)
 
   | e ->
-    `Assoc [
-      ("input", `String r);
-      ("result", `String "error");
-      ("error", `String (Printexc.to_string e))
-    ]
+    error_result r (Printexc.to_string e)
+
+(* runs in the worker processes, secs is the analysis budget (no limit if not positive); returns the result
+   along with the time spent in each phase and the NFA size (0 if the regex could not be compiled) *)
+let analyse_regex (r, secs) : Basic.t * (string * float) list * int =
+  let phases = Phases.create () in
+  let size = ref 0 in
+  let result = analyse_phases r secs phases size in
+  (result, Phases.to_list phases, !size)
+
+(* the analyses run on a pool of WORKERS (default: one per core) processes so that the accept loop
+   stays responsive, requests wait for a worker in FIFO order; WORKERS=0 analyses in-process *)
+type worker = {
+  proc : (string * float, Basic.t * (string * float) list * int) Workers.t;
+  ic : Lwt_io.input_channel;
+  oc : Lwt_io.output_channel
+}
+
+let worker_count = env_int "WORKERS" (Workers.cpu_count ())
+
+let spawn_worker () =
+  let proc = Workers.spawn analyse_regex in
+  {
+    proc;
+    ic = Lwt_io.of_unix_fd ~mode:Lwt_io.input (Workers.response_fd proc);
+    oc = Lwt_io.of_unix_fd ~mode:Lwt_io.output (Workers.request_fd proc)
+  }
+
+(* forked before the server starts listening, replacements for crashed workers are forked on demand (they close
+   the sockets and event loop fds inherited from the server) *)
+let idle_workers = ref (List.init (max worker_count 0) (fun _ -> spawn_worker ()))
+
+let worker_pool =
+  Lwt_pool.create (max worker_count 1)
+    ~check:(fun _ ok -> ok false)
+    ~dispose:(fun w -> Workers.stop w.proc ; Lwt.return_unit)
+    (fun () ->
+      match !idle_workers with
+      | w :: ws -> idle_workers := ws ; Lwt.return w
+      | [] -> Lwt.return (spawn_worker ()))
+
+let analyse_in_worker r secs =
+  if worker_count <= 0 then Lwt.return (analyse_regex (r, secs))
+  else
+    Lwt_pool.use worker_pool (fun w ->
+      Lwt_io.write_value w.oc (r, secs) >>= fun () ->
+      Lwt_io.flush w.oc >>= fun () ->
+      Lwt_io.read_value w.ic >|= fun (res : (Basic.t * (string * float) list * int, string) result) ->
+      match res with
+      | Ok analysis -> analysis
+      | Error e -> (error_result r e, [], 0))
+
+(* served at GET /metrics *)
+let metrics = Metrics.create ()
+let latency_buckets = [0.001; 0.005; 0.01; 0.05; 0.1; 0.5; 1.0; 5.0; 10.0; 30.0; 60.0]
+
+let () =
+  Metrics.register metrics "rxxr_http_requests_total" Metrics.Counter "HTTP requests by path" ;
+  Metrics.register metrics "rxxr_http_request_duration_seconds" (Metrics.Histogram latency_buckets)
+    "time to answer an HTTP request (to the last result for streams)" ;
+  Metrics.register metrics "rxxr_results_total" Metrics.Counter "regex results by class, cached ones included" ;
+  Metrics.register metrics "rxxr_analysis_duration_seconds" (Metrics.Histogram latency_buckets)
+    "time spent analysing a regex (cache misses only)" ;
+  Metrics.register metrics "rxxr_phase_duration_seconds" (Metrics.Histogram latency_buckets)
+    "time spent in each phase of an analysis (parse includes lexing)" ;
+  Metrics.register metrics "rxxr_nfa_states" (Metrics.Histogram [10.0; 50.0; 100.0; 500.0; 1000.0; 5000.0; 10000.0])
+    "number of NFA states of the analysed regexes" ;
+  Metrics.register metrics "rxxr_nfa_states_max" Metrics.Gauge "largest NFA analysed so far" ;
+  Metrics.register metrics "rxxr_cache_entries" Metrics.Gauge "number of cached results" ;
+  Metrics.register metrics "rxxr_cache_capacity" Metrics.Gauge "maximum number of cached results" ;
+  Metrics.register metrics "rxxr_cache_hits_total" Metrics.Counter "result cache hits" ;
+  Metrics.register metrics "rxxr_cache_misses_total" Metrics.Counter "result cache misses" ;
+  Metrics.register metrics "rxxr_workers" Metrics.Gauge "number of worker processes"
+
+let nfa_states_max = ref 0
+
+let record_analysis (phases, size) =
+  List.iter (fun (phase, t) -> Metrics.observe metrics "rxxr_phase_duration_seconds" [("phase", phase)] t) phases ;
+  Metrics.observe metrics "rxxr_analysis_duration_seconds" [] (List.fold_left (fun s (_, t) -> s +. t) 0.0 phases) ;
+  if size > 0 then begin
+    Metrics.observe metrics "rxxr_nfa_states" [] (float_of_int size) ;
+    nfa_states_max := max size !nfa_states_max ;
+    Metrics.set metrics "rxxr_nfa_states_max" [] (float_of_int !nfa_states_max)
+  end
+
+let record_result result =
+  let cls = match Basic.Util.member "result" result with
+    | `String c -> c
+    | _ -> "unknown" in
+  Metrics.inc metrics "rxxr_results_total" [("result", cls)] 1.0
+
+let render_metrics () =
+  Metrics.set metrics "rxxr_cache_entries" [] (float_of_int (Lru.length cache)) ;
+  Metrics.set metrics "rxxr_cache_capacity" [] (float_of_int (Lru.capacity cache)) ;
+  Metrics.set metrics "rxxr_cache_hits_total" [] (float_of_int (Lru.hits cache)) ;
+  Metrics.set metrics "rxxr_cache_misses_total" [] (float_of_int (Lru.misses cache)) ;
+  Metrics.set metrics "rxxr_workers" [] (float_of_int (max worker_count 0)) ;
+  Metrics.render metrics
+
+(* admission control: at most MAX_INFLIGHT analyses run at a time (default: one per worker), the others wait
+   in per-client queues served round-robin so that one client's burst does not hold up everybody else; requests
+   are turned away (429) once MAX_QUEUED analyses are waiting *)
+let max_inflight = max 1 (env_int "MAX_INFLIGHT" (max worker_count 1))
+let max_queued = env_int "MAX_QUEUED" 10000
+let max_regexes = env_int "MAX_REGEXES" 10000
+let max_body_bytes = env_int "MAX_BODY_BYTES" (1024 * 1024)
+let retry_after = env_int "RETRY_AFTER" 1
+
+type scheduler = {
+  mutable free : int; (* analysis slots available *)
+  mutable queued : int; (* analyses waiting for a slot *)
+  waiting : (string, unit Lwt.u Queue.t) Hashtbl.t; (* per client, non-empty queues only *)
+  clients : string Queue.t (* clients with waiting analyses, in round-robin order *)
+}
 
+let scheduler = { free = max_inflight; queued = 0; waiting = Hashtbl.create 64; clients = Queue.create () }
 
-let check_regexes ( rs : string list) : Basic.t =
-  `Assoc [ ("results", `List (List.map check_regex rs)) ]
+let acquire_slot client =
+  if scheduler.free > 0 then begin
+    scheduler.free <- scheduler.free - 1 ;
+    Lwt.return_unit
+  end else begin
+    let (t, u) = Lwt.wait () in
+    let q = try Hashtbl.find scheduler.waiting client with Not_found ->
+      let q = Queue.create () in
+      Hashtbl.replace scheduler.waiting client q ;
+      Queue.push client scheduler.clients ;
+      q in
+    Queue.push u q ;
+    scheduler.queued <- scheduler.queued + 1 ;
+    t
+  end
 
-let check_handler body =
+(* hand the slot over to the next client in turn, or give it back *)
+let release_slot () =
+  if Queue.is_empty scheduler.clients then
+    scheduler.free <- scheduler.free + 1
+  else begin
+    let client = Queue.pop scheduler.clients in
+    let q = Hashtbl.find scheduler.waiting client in
+    let u = Queue.pop q in
+    scheduler.queued <- scheduler.queued - 1 ;
+    if Queue.is_empty q then Hashtbl.remove scheduler.waiting client
+    else Queue.push client scheduler.clients ;
+    Lwt.wakeup_later u ()
+  end
+
+let with_slot client f =
+  acquire_slot client >>= fun () ->
+  Lwt.finalize f (fun () -> release_slot () ; Lwt.return_unit)
+
+(* whether n more analyses may be queued *)
+let admit n = scheduler.queued + n <= max_queued
+
+let is_timeout result =
+  Basic.Util.member "result" result = `String "timeout"
+
+(* analyses in progress, so that the same regex requested several times (within a batch or by concurrent
+   requests) is only analysed once *)
+let inflight : (string * float, Basic.t Lwt.t) Hashtbl.t = Hashtbl.create 64
+
+(* results of crashed workers and timed out analyses are not cached *)
+let analyse_shared client secs r =
+  match Hashtbl.find_opt inflight (r, secs) with
+  | Some p -> p
+  | None ->
+    let p = Lwt.catch
+      (fun () ->
+        with_slot client (fun () -> analyse_in_worker r secs) >|= fun (result, phases, size) ->
+        record_analysis (phases, size) ;
+        if not (is_timeout result) then (Lru.add cache (r, slim) result ; cache_dirty := true) ;
+        result)
+      (fun e -> Lwt.return (error_result r ("worker failed: " ^ Printexc.to_string e))) in
+    if Lwt.is_sleeping p then begin
+      Hashtbl.replace inflight (r, secs) p ;
+      Lwt.on_termination p (fun () -> Hashtbl.remove inflight (r, secs))
+    end ;
+    p
+
+let check_regex client secs r =
+  print_endline(Basic.to_string(`String r)) ;
+  match Lru.find cache (r, slim) with
+  | Some result -> record_result result ; Lwt.return result
+  | None ->
+    analyse_shared client secs r >|= fun result ->
+    record_result result ;
+    result
+
+let stats () =
+  `Assoc [
+    ("cache", `Assoc [
+      ("size", `Int (Lru.length cache));
+      ("capacity", `Int (Lru.capacity cache));
+      ("hits", `Int (Lru.hits cache));
+      ("misses", `Int (Lru.misses cache))
+    ])
+  ]
+
+(* each distinct regex of the batch is checked once, the results are then fanned back out in input order *)
+let check_regexes client ( rs : string list) secs : Basic.t Lwt.t =
+  let seen = Hashtbl.create 64 in
+  let unique = List.filter (fun r -> not (Hashtbl.mem seen r) && (Hashtbl.add seen r () ; true)) rs in
+  Lwt_list.map_p (check_regex client secs) unique >|= fun results ->
+  let by_regex = Hashtbl.create 64 in
+  List.iter2 (Hashtbl.replace by_regex) unique results ;
+  `Assoc [ ("results", `List (List.map (Hashtbl.find by_regex) rs)) ]
+
+let check_handler client body =
   try
     let json = Basic.from_string(body) in
     let regexes = (json |> Basic.Util.member "regexes" |> Basic.Util.convert_each Basic.Util.to_string) in
-    let results = check_regexes(regexes) in
+    (* optional per-regex analysis budget in seconds *)
+    let secs = match Basic.Util.member "timeout" json with
+      | `Null -> 0.0
+      | `Int i -> float_of_int i
+      | t -> Basic.Util.to_float t in
+    let n = List.length regexes in
+    if n > max_regexes then
+      Lwt.return (`Request_entity_too_large, Printf.sprintf "Too many regexes (%d), at most %d per request\n" n max_regexes)
+    else if not (admit n) then
+      Lwt.return (`Too_many_requests, "Server busy, try again later\n")
+    else
+    check_regexes client regexes secs >|= fun results ->
       (`OK, Basic.to_string(results))
   with
   | Json_error a ->
-    (`Bad_request, ("Invalid JSON\n" ^ a))
+    Lwt.return (`Bad_request, ("Invalid JSON\n" ^ a))
   | Basic.Util.Type_error (a, _) ->
-    (`Bad_request, ("Invalid JSON\n" ^ a))
+    Lwt.return (`Bad_request, ("Invalid JSON\n" ^ a))
 
-let callback _conn req body =
-  if (req |> Request.meth) <> `POST then
-    Server.respond_string ~status:`Method_not_allowed ~body:"405 Method not allowed\n" ()
-  else if (req |> Request.resource) <> "/check" then
-    Server.respond_string ~status:`Not_found ~body:("404 Not Found\n"^ (req |> Request.resource)) ()
+(* incremental scanner extracting the strings from NDJSON ("..." per line) or a JSON array (["...", ...]) of
+   regexes, fed with the chunks of the request body as they arrive *)
+exception Stream_error of string
+
+(* the stream is refused part way (too large, server busy), the message is sent as the error line *)
+exception Stream_rejected of string
+
+type scanner = {
+  literal : Buffer.t; (* raw contents of the current string literal *)
+  mutable in_string : bool;
+  mutable escaped : bool
+}
+
+let new_scanner () = { literal = Buffer.create 256; in_string = false; escaped = false }
+
+(* the strings completed by the chunk, in order *)
+let scan_chunk sc chunk =
+  let found = ref [] in
+  let finish () =
+    match Basic.from_string ("\"" ^ Buffer.contents sc.literal ^ "\"") with
+    | `String r -> found := r :: !found
+    | _ -> raise (Stream_error "invalid string")
+    | exception Json_error a -> raise (Stream_error a) in
+  String.iter (fun c ->
+    if sc.in_string then begin
+      if sc.escaped then (Buffer.add_char sc.literal c ; sc.escaped <- false)
+      else if c = '\\' then (Buffer.add_char sc.literal c ; sc.escaped <- true)
+      else if c = '"' then (finish () ; sc.in_string <- false)
+      else Buffer.add_char sc.literal c
+    end else
+      match c with
+      | ' ' | '\t' | '\r' | '\n' | '[' | ']' | ',' -> ()
+      | '"' -> Buffer.clear sc.literal ; sc.in_string <- true
+      | _ -> raise (Stream_error (Printf.sprintf "unexpected character '%c'" c))
+  ) chunk ;
+  List.rev !found
+
+(* number of regexes of a stream analysed at the same time *)
+let stream_inflight = env_int "STREAM_INFLIGHT" (2 * max worker_count 1)
+
+(* one NDJSON line per regex, in completion order and tagged with the input index; the input is only read
+   as fast as the analyses progress and the output is bounded, so memory stays flat; finished is called once
+   the last line is out *)
+let check_stream client secs body closed finished =
+  let (out, push) = Lwt_stream.create_bounded stream_inflight in
+  let line json = Basic.to_string json ^ "\n" in
+  (* once the client is gone nobody reads the stream any more: closing it fails the pending and further pushes
+     (Lwt_stream.Closed), so that the analyses below still run to their finalisers and free their slots *)
+  let gone = ref false in
+  Lwt.on_success closed (fun () -> gone := true ; push#close) ;
+  (* a bounded stream accepts a single waiting push *)
+  let pushing = Lwt_mutex.create () in
+  let push_line json =
+    Lwt.catch
+      (fun () -> Lwt_mutex.with_lock pushing (fun () -> push#push (line json)))
+      (function Lwt_stream.Closed -> Lwt.return_unit | e -> Lwt.fail e) in
+  let active = ref 0 in
+  let slot_freed = Lwt_condition.create () in
+  let rec acquire () =
+    if !active < stream_inflight then (incr active ; Lwt.return_unit)
+    else Lwt_condition.wait slot_freed >>= acquire in
+  let rec wait_all () =
+    if !active = 0 then Lwt.return_unit
+    else Lwt_condition.wait slot_freed >>= wait_all in
+  let index = ref 0 in
+  let analyse r =
+    let i = !index in
+    incr index ;
+    if !gone then
+      Lwt.fail (Stream_error "client disconnected")
+    else if i >= max_regexes then
+      Lwt.fail (Stream_error (Printf.sprintf "too many regexes, at most %d per request" max_regexes))
+    else if not (admit 1) then
+      Lwt.fail (Stream_rejected "Server busy, try again later\n")
+    else
+    acquire () >|= fun () ->
+    Lwt.async (fun () ->
+      Lwt.finalize
+        (fun () ->
+          check_regex client secs r >>= fun result ->
+          let tagged = match result with
+            | `Assoc fields -> `Assoc (("index", `Int i) :: fields)
+            | other -> `Assoc [ ("index", `Int i); ("result", other) ] in
+          push_line tagged)
+        (fun () -> decr active ; Lwt_condition.broadcast slot_freed () ; Lwt.return_unit)) in
+  let sc = new_scanner () in
+  (* the body is held to MAX_BODY_BYTES like a /check body, which also bounds the string literals *)
+  let read = ref 0 in
+  let scan chunk =
+    read := !read + String.length chunk ;
+    if !read > max_body_bytes then
+      Lwt.fail (Stream_rejected (Printf.sprintf "Request body too large, at most %d bytes\n" max_body_bytes))
+    else Lwt_list.iter_s analyse (scan_chunk sc chunk) in
+  Lwt.async (fun () ->
+    Lwt.finalize
+      (fun () ->
+        Lwt.catch
+          (fun () ->
+            Cohttp_lwt.Body.to_stream body |> Lwt_stream.iter_s scan >>= fun () ->
+            if sc.in_string then Lwt.fail (Stream_error "unterminated string") else Lwt.return_unit)
+          (fun e ->
+            let msg = match e with
+              | Stream_error a -> "Invalid input\n" ^ a
+              | Stream_rejected a -> a
+              | e -> "Invalid input\n" ^ Printexc.to_string e in
+            wait_all () >>= fun () ->
+            push_line (`Assoc [ ("error", `String msg) ]))
+        >>= wait_all)
+      (fun () -> push#close ; finished () ; Lwt.return_unit)) ;
+  out
+
+(* the streams in progress on each connection, woken when the connection closes; a keep-alive connection may carry
+   many streams in turn, so each one has its own promise and leaves the list when it finishes *)
+let connection_streams : (Cohttp.Connection.t, unit Lwt.u Lwt_dllist.t) Hashtbl.t = Hashtbl.create 64
+
+(* a promise resolved if the connection closes, and the function forgetting it once the stream is over *)
+let watch_connection conn =
+  let streams = match Hashtbl.find_opt connection_streams (snd conn) with
+    | Some streams -> streams
+    | None ->
+      let streams = Lwt_dllist.create () in
+      Hashtbl.replace connection_streams (snd conn) streams ;
+      streams in
+  let (t, u) = Lwt.wait () in
+  let node = Lwt_dllist.add_r u streams in
+  let unwatch () =
+    Lwt_dllist.remove node ;
+    match Hashtbl.find_opt connection_streams (snd conn) with
+    | Some s when s == streams && Lwt_dllist.is_empty s -> Hashtbl.remove connection_streams (snd conn)
+    | _ -> () in
+  (t, unwatch)
+
+let conn_closed conn =
+  match Hashtbl.find_opt connection_streams (snd conn) with
+  | Some streams ->
+    Hashtbl.remove connection_streams (snd conn) ;
+    Lwt_dllist.iter_l (fun u -> Lwt.wakeup_later u ()) streams
+  | None -> ()
+
+(* the length announced by the client, 0 if none *)
+let declared_length req =
+  match Header.get (Request.headers req) "content-length" with
+  | Some l -> (try int_of_string l with Failure _ -> 0)
+  | None -> 0
+
+(* the body, None if it exceeds MAX_BODY_BYTES (checked against Content-Length before reading anything) *)
+exception Body_too_large
+
+let read_body req body =
+  if declared_length req > max_body_bytes then Lwt.return None
   else
-    body |> Cohttp_lwt.Body.to_string
-    >|= check_handler
+    let b = Buffer.create 4096 in
+    Lwt.catch
+      (fun () ->
+        Cohttp_lwt.Body.to_stream body
+        |> Lwt_stream.iter (fun chunk ->
+          if Buffer.length b + String.length chunk > max_body_bytes then raise Body_too_large ;
+          Buffer.add_string b chunk)
+        >|= fun () -> Some (Buffer.contents b))
+      (function
+        | Body_too_large -> Lwt.return None
+        | e -> Lwt.fail e)
+
+(* clients are told apart by the last X-Forwarded-For entry (the one appended by the front end), or the peer address *)
+let client_id conn req =
+  match Header.get (Request.headers req) "x-forwarded-for" with
+  (* the client controls every entry but the last one, which the front end (e.g. Cloud Run's) appends with the
+     address it actually saw; keying on an earlier entry would let a client pick a fresh identity per request *)
+  | Some v -> String.trim (List.hd (List.rev (String.split_on_char ',' v)))
+  | None ->
+    match fst conn with
+    | Conduit_lwt_unix.TCP { Conduit_lwt_unix.ip; _ } -> Ipaddr.to_string ip
+    | _ -> "local"
+
+let respond_error status body =
+  let headers = match status with
+    | `Too_many_requests -> Header.add cors_headers "Retry-After" (string_of_int retry_after)
+    | _ -> cors_headers in
+  Server.respond_string ~headers ~status ~body ()
+
+let route conn client req body finished =
+  match (req |> Request.meth), (req |> Request.uri |> Uri.path) with
+  | `GET, "/metrics" ->
+    let headers = Header.add cors_headers "Content-Type" "text/plain; version=0.0.4" in
+    Server.respond_string ~headers ~status:`OK ~body:(render_metrics ()) ()
+  | `GET, "/stats" ->
+    Server.respond_string ~headers:cors_headers ~status:`OK ~body:(Basic.to_string (stats ())) ()
+  | `POST, "/check" ->
+    read_body req body
+    >>= (function
+      | None -> Lwt.return (`Request_entity_too_large, Printf.sprintf "Request body too large, at most %d bytes\n" max_body_bytes)
+      | Some body -> check_handler client body)
     >>= (fun (status, body) ->
-      let headers = cors_headers in
-       Server.respond_string ~headers ~status ~body ())
+      match status with
+      | `OK ->
+        let headers = cors_headers in
+         Server.respond_string ~headers ~status ~body ()
+      | _ -> respond_error status body)
+  | `POST, "/check/stream" when not (admit 1) ->
+    respond_error `Too_many_requests "Server busy, try again later\n"
+  | `POST, "/check/stream" when declared_length req > max_body_bytes ->
+    respond_error `Request_entity_too_large (Printf.sprintf "Request body too large, at most %d bytes\n" max_body_bytes)
+  | `POST, "/check/stream" ->
+    (* optional per-regex analysis budget in seconds *)
+    let secs = match Uri.get_query_param (Request.uri req) "timeout" with
+      | Some t -> (try float_of_string t with Failure _ -> 0.0)
+      | None -> 0.0 in
+    let headers = Header.add cors_headers "Content-Type" "application/x-ndjson" in
+    let (closed, unwatch) = watch_connection conn in
+    let finished () = unwatch () ; finished () in
+    Server.respond ~headers ~status:`OK ~body:(Cohttp_lwt.Body.of_stream (check_stream client secs body closed finished)) ()
+  | _, "/check" | _, "/check/stream" | _, "/stats" | _, "/metrics" ->
+    Server.respond_string ~status:`Method_not_allowed ~body:"405 Method not allowed\n" ()
+  | _ ->
+    Server.respond_string ~status:`Not_found ~body:("404 Not Found\n"^ (req |> Request.resource)) ()
+
+(* counts and times every request, streams are timed up to their last line *)
+let callback conn req body =
+  let path = req |> Request.uri |> Uri.path in
+  let label = match path with
+    | "/check" | "/check/stream" | "/stats" | "/metrics" -> path
+    | _ -> "other" in
+  Metrics.inc metrics "rxxr_http_requests_total" [("path", label)] 1.0 ;
+  let ts = Unix.gettimeofday () in
+  let finished () =
+    Metrics.observe metrics "rxxr_http_request_duration_seconds" [("path", label)] (Unix.gettimeofday () -. ts) in
+  let streaming = (req |> Request.meth) = `POST && path = "/check/stream" in
+  route conn (client_id conn req) req body finished >|= fun response ->
+  if not streaming then finished () ;
+  response
+
+(* a write to a crashed worker must not kill the server *)
+let () = Sys.set_signal Sys.sigpipe Sys.Signal_ignore
+
+let () =
+  match cache_file with
+  | None -> ()
+  | Some fname ->
+    (* loaded before the server starts listening, so that a restart does not begin with a cold cache *)
+    if Sys.file_exists fname then load_cache fname ;
+    if snapshot_secs > 0 then Lwt.async (fun () -> snapshot_loop fname) ;
+    at_exit (fun () -> save_cache fname) ;
+    (* at_exit handlers only run on a normal exit *)
+    Sys.set_signal Sys.sigterm (Sys.Signal_handle (fun _ -> exit 0)) ;
+    Sys.set_signal Sys.sigint (Sys.Signal_handle (fun _ -> exit 0))
 
 let port = try Sys.getenv "PORT" |> int_of_string
            with Not_found -> 8181
 let server =
-  Server.create ~mode:(`TCP (`Port port)) (Server.make ~callback ())
+  Server.create ~mode:(`TCP (`Port port)) (Server.make ~callback ~conn_closed ())
 
 let () = 
   (print_endline "Running!") ;;
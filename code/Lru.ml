@@ -0,0 +1,85 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* entries form a doubly-linked list ordered by recency of use, the hash table points into the list *)
+type ('k, 'v) node = {
+  key : 'k;
+  mutable value : 'v;
+  mutable prev : ('k, 'v) node option; (* more recently used *)
+  mutable next : ('k, 'v) node option  (* less recently used *)
+};;
+
+type ('k, 'v) t = {
+  size : int;
+  table : ('k, ('k, 'v) node) Hashtbl.t;
+  mutable first : ('k, 'v) node option; (* most recently used *)
+  mutable last : ('k, 'v) node option; (* least recently used *)
+  mutable hits : int;
+  mutable misses : int
+};;
+
+let create n = {
+  size = max n 1;
+  table = Hashtbl.create (min (max n 1) 4096);
+  first = None;
+  last = None;
+  hits = 0;
+  misses = 0
+};;
+
+let unlink c n =
+  let _ = match n.prev with
+    |None -> c.first <- n.next
+    |Some p -> p.next <- n.next in
+  let _ = match n.next with
+    |None -> c.last <- n.prev
+    |Some s -> s.prev <- n.prev in
+  n.prev <- None;
+  n.next <- None;;
+
+let push_front c n =
+  n.next <- c.first;
+  let _ = match c.first with
+    |None -> c.last <- Some n
+    |Some f -> f.prev <- Some n in
+  c.first <- Some n;;
+
+let find c k =
+  try
+    let n = Hashtbl.find c.table k in
+    unlink c n;
+    push_front c n;
+    c.hits <- c.hits + 1;
+    Some n.value
+  with Not_found ->
+    c.misses <- c.misses + 1;
+    None;;
+
+let add c k v =
+  try
+    let n = Hashtbl.find c.table k in
+    n.value <- v;
+    unlink c n;
+    push_front c n
+  with Not_found ->
+    let _ = if Hashtbl.length c.table >= c.size then begin
+      match c.last with
+        |None -> ()
+        |Some l ->
+          unlink c l;
+          Hashtbl.remove c.table l.key
+    end in
+    let n = {key = k; value = v; prev = None; next = None} in
+    Hashtbl.replace c.table k n;
+    push_front c n;;
+
+let length c = Hashtbl.length c.table;;
+let capacity c = c.size;;
+
+let hits c = c.hits;;
+let misses c = c.misses;;
+
+let to_list c =
+  let rec collect n l = match n with
+    |None -> l
+    |Some n -> collect n.next ((n.key, n.value) :: l) in
+  collect c.first [];;
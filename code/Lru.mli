@@ -0,0 +1,24 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* bounded key-value cache with least-recently-used eviction *)
+type ('k, 'v) t;;
+
+(* create an empty cache holding at most the specified number of entries *)
+val create : int -> ('k, 'v) t;;
+
+(* look up a key, marking the entry as most recently used; counts a hit or a miss *)
+val find : ('k, 'v) t -> 'k -> 'v option;;
+
+(* insert (or replace) an entry as the most recently used one, evicting the least recently used if full *)
+val add : ('k, 'v) t -> 'k -> 'v -> unit;;
+
+(* number of entries / maximum number of entries *)
+val length : ('k, 'v) t -> int;;
+val capacity : ('k, 'v) t -> int;;
+
+(* hit / miss counters of find *)
+val hits : ('k, 'v) t -> int;;
+val misses : ('k, 'v) t -> int;;
+
+(* entries ordered from the least to the most recently used, adding them in this order restores the cache *)
+val to_list : ('k, 'v) t -> ('k * 'v) list;;
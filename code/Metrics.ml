@@ -0,0 +1,110 @@
+(* © Copyright University of Birmingham, UK *)
+
+type kind =
+  |Counter
+  |Gauge
+  |Histogram of float list;;
+
+type labels = (string * string) list;;
+
+type hist = {
+  bounds : float array;
+  (* observations per bucket, not cumulative *)
+  counts : int array;
+  mutable sum : float;
+  mutable count : int
+};;
+
+type series =
+  |Scalar of float ref
+  |Hist of hist;;
+
+type family = {
+  name : string;
+  kind : kind;
+  help : string;
+  series : (labels, series) Hashtbl.t
+};;
+
+type t = {
+  (* families in reverse declaration order *)
+  mutable families : family list;
+  index : (string, family) Hashtbl.t
+};;
+
+let create () = {families = []; index = Hashtbl.create 16};;
+
+let register m name kind help =
+  if Hashtbl.mem m.index name then invalid_arg ("Metrics.register: " ^ name);
+  let f = {name = name; kind = kind; help = help; series = Hashtbl.create 8} in
+  Hashtbl.add m.index name f;
+  m.families <- f :: m.families;;
+
+let find_series m name labels =
+  let f = try Hashtbl.find m.index name with Not_found -> invalid_arg ("Metrics: unknown metric " ^ name) in
+  try Hashtbl.find f.series labels with Not_found ->
+    let s = match f.kind with
+      |Counter | Gauge -> Scalar (ref 0.0)
+      |Histogram bounds ->
+        let b = Array.of_list bounds in
+        Hist {bounds = b; counts = Array.make (Array.length b) 0; sum = 0.0; count = 0} in
+    Hashtbl.add f.series labels s;
+    s;;
+
+let inc m name labels v = match find_series m name labels with
+  |Scalar r -> r := !r +. v
+  |Hist _ -> invalid_arg ("Metrics.inc: " ^ name);;
+
+let set m name labels v = match find_series m name labels with
+  |Scalar r -> r := v
+  |Hist _ -> invalid_arg ("Metrics.set: " ^ name);;
+
+let observe m name labels v = match find_series m name labels with
+  |Scalar _ -> invalid_arg ("Metrics.observe: " ^ name)
+  |Hist h ->
+    let rec bucket i =
+      if i < Array.length h.bounds then
+        if v <= h.bounds.(i) then h.counts.(i) <- h.counts.(i) + 1 else bucket (i + 1) in
+    bucket 0;
+    h.sum <- h.sum +. v;
+    h.count <- h.count + 1;;
+
+let escape v =
+  let b = Buffer.create (String.length v) in
+  String.iter (fun c -> match c with
+    |'\\' -> Buffer.add_string b "\\\\"
+    |'"' -> Buffer.add_string b "\\\""
+    |'\n' -> Buffer.add_string b "\\n"
+    |c -> Buffer.add_char b c
+  ) v;
+  Buffer.contents b;;
+
+let print_labels labels = match labels with
+  |[] -> ""
+  |_ -> Printf.sprintf "{%s}" (String.concat "," (List.map (fun (k, v) -> Printf.sprintf "%s=\"%s\"" k (escape v)) labels));;
+
+let print_value v = Printf.sprintf "%.9g" v;;
+
+let render m =
+  let b = Buffer.create 4096 in
+  List.iter (fun f ->
+    let tname = match f.kind with
+      |Counter -> "counter"
+      |Gauge -> "gauge"
+      |Histogram _ -> "histogram" in
+    Printf.bprintf b "# HELP %s %s\n# TYPE %s %s\n" f.name f.help f.name tname;
+    let keys = List.sort compare (Hashtbl.fold (fun k _ l -> k :: l) f.series []) in
+    List.iter (fun labels -> match Hashtbl.find f.series labels with
+      |Scalar r -> Printf.bprintf b "%s%s %s\n" f.name (print_labels labels) (print_value !r)
+      |Hist h ->
+        let total = ref 0 in
+        Array.iteri (fun i bound ->
+          total := !total + h.counts.(i);
+          Printf.bprintf b "%s_bucket%s %d\n" f.name (print_labels (labels @ [("le", Printf.sprintf "%g" bound)])) !total
+        ) h.bounds;
+        Printf.bprintf b "%s_bucket%s %d\n" f.name (print_labels (labels @ [("le", "+Inf")])) h.count;
+        Printf.bprintf b "%s_sum%s %s\n" f.name (print_labels labels) (print_value h.sum);
+        Printf.bprintf b "%s_count%s %d\n" f.name (print_labels labels) h.count
+    ) keys
+  ) (List.rev m.families);
+  Buffer.contents b;;
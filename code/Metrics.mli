@@ -0,0 +1,31 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* registry of metrics, rendered in the prometheus text exposition format *)
+type t;;
+
+(* kinds of metrics, histograms come with their (ascending) bucket upper bounds *)
+type kind =
+  |Counter
+  |Gauge
+  |Histogram of float list;;
+
+(* label name / value pairs identifying a series of a metric *)
+type labels = (string * string) list;;
+
+(* create an empty registry *)
+val create : unit -> t;;
+
+(* declare a metric with its kind and help text, raises Invalid_argument if already declared *)
+val register : t -> string -> kind -> string -> unit;;
+
+(* add to a counter or gauge *)
+val inc : t -> string -> labels -> float -> unit;;
+
+(* set a counter or gauge *)
+val set : t -> string -> labels -> float -> unit;;
+
+(* record an observation in a histogram *)
+val observe : t -> string -> labels -> float -> unit;;
+
+(* render all the metrics, in declaration order *)
+val render : t -> string;;
@@ -34,6 +34,14 @@ type t = {
   states : s array; 
   (* an ordered list of transitions corresponding to each state - lazily initialized *)
   transitions : (char * char * int) list option array; 
+  (* the epsilon closure (as seen by the analysers) of each state - lazily initialized *)
+  closures : int array option array;
+  (* alphabet partition - the character ranges no transition boundary falls into, in ascending order *)
+  classes : (char * char) array;
+  (* class of each character *)
+  class_of : int array;
+  (* transitions of each state over class ranges - lazily initialized *)
+  class_transitions : (int * int * int) list option array;
   (* sub-expression positions corresponding to each state *)
   positions : (int * int) array; 
   (* root state index *)
@@ -197,6 +205,25 @@ let rec compile r sv pv next kont flags = match (fst r) with
     sv.(next_o) <- BranchKln (qf == Gq, kont_mb, kont_o);
     (next_mb, next_o);;
 
+(* split the characters into the ranges delimited by the character classes of all the match states *)
+let make_classes sv =
+  let starts = Array.make 257 false in
+  let mark c = starts.(c) <- true in
+  (* the end of the analysed alphabet is always a boundary *)
+  mark 0; mark (Char.code zmax + 1); mark 256;
+  Array.iter (fun s -> match s with
+    |Match (cls, _) -> List.iter (fun (u, v) -> mark (Char.code u); mark (Char.code v + 1)) cls
+    |_ -> ()
+  ) sv;
+  let rec collect c lo lst =
+    if c > 256 then List.rev lst
+    else if starts.(c) then collect (c + 1) c (if c > lo then (Char.chr lo, Char.chr (c - 1)) :: lst else lst)
+    else collect (c + 1) lo lst in
+  let classes = Array.of_list (collect 1 0 []) in
+  let class_of = Array.make 256 0 in
+  Array.iteri (fun k (u, v) -> Array.fill class_of (Char.code u) (Char.code v - Char.code u + 1) k) classes;
+  (classes, class_of);;
+
 let make (r, flags) =
   let _ = decorate_regex r flags in 
   let state_count = (snd r).scount + 1 in (* + 1 for the final state *)
@@ -204,7 +231,9 @@ let make (r, flags) =
   let tv = Array.make state_count None in
   let pv = Array.make state_count (r_epos r, r_epos r) in
   let (_, kont) = compile r sv pv (state_count - 2) (state_count - 1) flags in
-  {states = sv; transitions = tv; positions = pv; root = kont};;
+  let (classes, class_of) = make_classes sv in
+  {states = sv; transitions = tv; closures = Array.make state_count None; classes = classes; class_of = class_of;
+   class_transitions = Array.make state_count None; positions = pv; root = kont};;
 
 let root nfa = nfa.root;;
 
@@ -241,4 +270,90 @@ let get_transitions nfa i =
       let (_, lst) = explore i (IntSet.empty, []) in
       nfa.transitions.(i) <- Some lst; lst;;
 
+let class_count nfa = Array.length nfa.classes;;
+
+let class_range nfa k = nfa.classes.(k);;
+
+let get_class_transitions nfa i = match nfa.class_transitions.(i) with
+  |Some lst -> lst
+  |None ->
+    let lst = List.map (fun (u, v, j) -> (nfa.class_of.(Char.code u), nfa.class_of.(Char.code v), j)) (get_transitions nfa i) in
+    nfa.class_transitions.(i) <- Some lst; lst;;
+
+let get_closure nfa i =
+  (* same walk as the analysers perform, except that predicates are not followed *)
+  let rec explore l st lst = match l with
+    |[] -> lst
+    |i :: t when IntSet.mem i st -> explore t st lst
+    |i :: t ->
+      let st = IntSet.add i st in
+      match get_state nfa i with
+        |Pass j -> explore (j :: t) st lst
+        |MakeB j -> explore (j :: t) st lst
+        |EvalB j -> explore (j :: t) st lst
+        |BeginCap (_, j) -> explore (j :: t) st lst
+        |EndCap (_, j) -> explore (j :: t) st lst
+        |BranchAlt (j, k) -> explore (j :: k :: t) st lst
+        (* quantifiers affect the ordering of the closure *)
+        |BranchKln (gd, j, k) -> explore (if gd then j :: k :: t else k :: j :: t) st (i :: lst)
+        |End |Kill |Match _ |CheckPred _ |CheckBackref _ -> explore t st (i :: lst) in
+  match nfa.closures.(i) with
+    |Some c -> c
+    |None ->
+      let c = Array.of_list (List.rev (explore [i] IntSet.empty [])) in
+      nfa.closures.(i) <- Some c; c;;
+
 let get_subexp_location nfa i = nfa.positions.(i);;
+
+(* predicate codes used in the canonical form *)
+let pred_code p = match p with
+  |P_BOI -> "A"
+  |P_EOI -> "z"
+  |P_EOIX ulines -> if ulines then "Zu" else "Z"
+  |P_BOL ulines -> if ulines then "^u" else "^"
+  |P_EOL ulines -> if ulines then "$u" else "$"
+  |P_EOM -> "G"
+  |P_WB -> "b"
+  |P_NWB -> "B";;
+
+let canonical nfa =
+  let n = size nfa in
+  let number = Array.make n (-1) in
+  let state = Array.make n (-1) in
+  let count = ref 0 in
+  let queue = Queue.create () in
+  (* the analysers treat these as plain epsilon moves, so they are skipped over (chains end in a branch at the latest) *)
+  let rec skip i = match nfa.states.(i) with
+    |Pass j | MakeB j | EvalB j | BeginCap (_, j) | EndCap (_, j) -> skip j
+    |_ -> i in
+  let visit i =
+    let i = skip i in
+    if number.(i) < 0 then (
+      number.(i) <- !count;
+      state.(!count) <- i;
+      count := !count + 1;
+      Queue.push i queue
+    );
+    number.(i) in
+  let buf = Buffer.create (16 * n) in
+  let _ = visit nfa.root in
+  (* states are described in the order they are numbered (breadth-first from the root) *)
+  while not (Queue.is_empty queue) do
+    match nfa.states.(Queue.pop queue) with
+      |End -> Buffer.add_string buf "E;"
+      |Kill -> Buffer.add_string buf "K;"
+      |Match (cls, j) ->
+        Buffer.add_char buf 'M';
+        List.iter (fun (u, v) -> Printf.bprintf buf "%02x%02x" (Char.code u) (Char.code v)) cls;
+        Printf.bprintf buf ">%d;" (visit j)
+      |CheckPred (p, j) -> Printf.bprintf buf "P%s>%d;" (pred_code p) (visit j)
+      |CheckBackref (k, j) -> Printf.bprintf buf "R%d>%d;" k (visit j)
+      |BranchAlt (j, k) ->
+        let j = visit j in
+        Printf.bprintf buf "A%d,%d;" j (visit k)
+      |BranchKln (gd, j, k) ->
+        let j = visit j in
+        Printf.bprintf buf "L%c%d,%d;" (if gd then 'g' else 'r') j (visit k)
+      |Pass _ | MakeB _ | EvalB _ | BeginCap _ | EndCap _ -> ()
+  done;
+  (Buffer.contents buf, number, Array.sub state 0 !count);;
@@ -45,5 +45,28 @@ val get_state : t -> int -> s;;
 (* return the list of ordered transitions for the specified state *)
 val get_transitions : t -> int -> (char * char * int) list;;
 
+(*
+  - the alphabet is split into classes, ranges of characters that every transition either fully includes or excludes
+  - class_count returns their number, class_range the characters of a class (classes are numbered in ascending order)
+*)
+val class_count : t -> int;;
+val class_range : t -> int -> (char * char);;
+
+(* same as get_transitions, with the character ranges given as (first, last) class numbers *)
+val get_class_transitions : t -> int -> (int * int * int) list;;
+
+(*
+  - return the epsilon closure of the specified state (lazily computed, once per state)
+  - lists the kleene, match, end / kill, predicate and backreference states reachable through epsilon moves, in
+    the order a left-to-right walk (respecting quantifier greediness) first reaches them
+  - predicates are not followed, their continuation depends on the prefix word at analysis time
+*)
+val get_closure : t -> int -> int array;;
+
 (* return sub-expression position in the input string *)
 val get_subexp_location : t -> int -> (int * int);;
+
+(* canonical form of the NFA: a description of the states reachable from the root, numbered in the order they are
+   reached and skipping over pure epsilon states (including capturing group boundaries), so that patterns compiling
+   to the same automaton share it; also returns the number of each state (-1 if skipped) and the state of each number *)
+val canonical : t -> string * int array * int array;;
@@ -0,0 +1,24 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* there are only a handful of phases, an association list is good enough *)
+type t = {
+  mutable phases : (string * float ref) list
+};;
+
+let create () = {phases = []};;
+
+let slot p name =
+  try List.assoc name p.phases with Not_found ->
+    let r = ref 0.0 in
+    p.phases <- p.phases @ [(name, r)];
+    r;;
+
+let time p name f =
+  let r = slot p name in
+  let ts = Unix.gettimeofday () in
+  let finish () = r := !r +. (Unix.gettimeofday () -. ts) in
+  match f () with
+    |v -> finish (); v
+    |exception e -> finish (); raise e;;
+
+let to_list p = List.map (fun (name, r) -> (name, !r)) p.phases;;
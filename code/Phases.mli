@@ -0,0 +1,13 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* wall-clock time spent in the named phases of an analysis *)
+type t;;
+
+(* no time spent in any phase *)
+val create : unit -> t;;
+
+(* run the function, adding the time it takes to the specified phase *)
+val time : t -> string -> (unit -> 'a) -> 'a;;
+
+(* total time (seconds) of each phase, in the order the phases were first timed *)
+val to_list : t -> (string * float) list;;
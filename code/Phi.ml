@@ -3,110 +3,187 @@
 open Common
 open Nfa
 
-(* a phi is represented by a set of integers *)
-type t = IntSet.t;;
+(*
+  - the states of a phi are kept in a packed bitset, Sys.int_size states per word
+  - trailing zero words are dropped, so that equal sets are structurally equal
+*)
+type bitset = int array;;
 
-module PhiSet = Set.Make (
+(* phis are hash-consed: each distinct set of states is represented by a single value with a unique id *)
+type t = {id : int; bits : bitset};;
+
+let bits = Sys.int_size;;
+
+(* number of words needed for states 0 .. n - 1 *)
+let words n = (n + bits - 1) / bits;;
+
+(* mutable working sets (of some fixed size) used while building a phi *)
+let bv_create n = Array.make (words n) 0;;
+
+let bv_mem bv i = bv.(i / bits) land (1 lsl (i mod bits)) <> 0;;
+
+let bv_add bv i = bv.(i / bits) <- bv.(i / bits) lor (1 lsl (i mod bits));;
+
+(* drop the trailing zero words of a working set *)
+let pack bv =
+  let rec last k = if k >= 0 && bv.(k) == 0 then last (k - 1) else k in
+  Array.sub bv 0 (last (Array.length bv - 1) + 1);;
+
+(* fold over the states of a bitset in ascending order *)
+let fold f bv acc =
+  let acc = ref acc in
+  Array.iteri (fun k w ->
+    if w != 0 then
+      for b = 0 to bits - 1 do
+        if w land (1 lsl b) <> 0 then acc := f (k * bits + b) !acc
+      done
+  ) bv;
+  !acc;;
+
+(* the interned phis, entries go away once the phis are no longer referenced *)
+module Interned = Weak.Make (
   struct
-    type t = IntSet.t;;
-    let compare = IntSet.compare;;
+    type nonrec t = t;;
+    let equal p1 p2 = p1.bits = p2.bits;;
+    let hash p = Array.fold_left (fun h w -> (h * 31 + w) land max_int) (Array.length p.bits) p.bits;;
   end);;
 
-let make ist = ist;;
+let interned = Interned.create 4096;;
+let next_id = ref 0;;
 
-let elems p = p;;
+(* the unique phi with the given (packed) states *)
+let intern bv =
+  let p = {id = !next_id; bits = bv} in
+  let q = Interned.merge interned p in
+  if q == p then next_id := !next_id + 1;
+  q;;
 
-let compare p1 p2 = IntSet.compare p1 p2;;
+let make ist =
+  if IntSet.is_empty ist then intern [||] else
+    let bv = bv_create (IntSet.max_elt ist + 1) in
+    IntSet.iter (bv_add bv) ist; intern bv;;
 
-let subset p1 p2 = IntSet.subset p1 p2;;
+let elems p = fold IntSet.add p.bits IntSet.empty;;
 
-let print p = IntSet.fold (fun i s -> Printf.sprintf "%s%d," s i) p "";;
+let id p = p.id;;
 
-(* a sorted tree of phis *)
-type itree = ITNull | ITNode of char * char * IntSet.t * itree * itree;;
+let compare p1 p2 = Stdlib.compare p1.id p2.id;;
 
-(* insert new phi, overlapping ranges create bigger (union) phis *)
-let rec itr_add tr _u _v _s = match tr with
-  |ITNull -> ITNode (_u, _v, _s, ITNull, ITNull)
-  |ITNode (u, v, s, ltr, rtr) when _v < u -> ITNode (u, v, s, itr_add ltr _u _v _s, rtr)
-  |ITNode (u, v, s, ltr, rtr) when v < _u -> ITNode (u, v, s, ltr, itr_add rtr _u _v _s)
-  |ITNode (u, v, s, ltr, rtr) ->
-    let _ltr = if u == _u then ltr else if u < _u then itr_add ltr u (zprev _u) s else itr_add ltr _u (zprev u) _s in
-    let _rtr = if v == _v then rtr else if _v < v then itr_add rtr (znext _v) v s else itr_add rtr (znext v) _v _s in
-    ITNode (max u _u, min v _v, IntSet.union _s s, _ltr, _rtr);;
+let equal p1 p2 = p1 == p2;;
 
-(* collect all the phis in the tree, along with the corresponding prefixes *)
-let rec itr_collect tr w lst = match tr with
-  |ITNull -> lst
-  |ITNode (u, v, s, ltr, rtr) ->
-    itr_collect rtr w (itr_collect ltr w ((Word.extend w (u, v), s) :: lst));;
+let hash p = p.id;;
 
-(* find characters which yield no phis - useful when we want to fail the current phi *)
-let itr_find_nomatch tr =
-  let rec explore tr next lst = match tr with
-    |ITNull -> (next, lst)
-    |ITNode (u, v, _, ltr, rtr) ->
-      let (next, lst) = explore rtr next lst in
-      let (next, lst) = if v == (zprev next) then (u, lst) else (u, (znext v, zprev next) :: lst) in
-      explore ltr next lst in
-  let (next, lst) = explore tr '\x80' [] in
-  if '\x00' < next then ('\x00', zprev next) :: lst else lst;;
+module PhiSet = Set.Make (
+  struct
+    type nonrec t = t;;
+    let compare = compare;;
+  end);;
 
-let advance (nfa, w, p) =
-  (* each transition gets added to the phi tree individually, the tree groups the transitions to make phis *)
-  let tr = IntSet.fold (fun i tr -> List.fold_left (fun tr (u, v, j) -> itr_add tr u v (IntSet.singleton j)) tr (Nfa.get_transitions nfa i)) p ITNull in
-  itr_collect tr w [];;
+(* memoized subset results on pairs of ids, cleared once it grows too large *)
+let subset_memo : (int * int, bool) Hashtbl.t = Hashtbl.create 4096;;
+let subset_memo_limit = 1 lsl 16;;
+
+(* the last word of a bitset is non-zero, so a longer one cannot be a subset of a shorter one *)
+let bv_subset bv1 bv2 =
+  let n = Array.length bv1 in
+  let rec check k = k == n || (bv1.(k) land (lnot bv2.(k)) == 0 && check (k + 1)) in
+  n <= Array.length bv2 && check 0;;
+
+let subset p1 p2 =
+  if p1 == p2 then true else
+    match Hashtbl.find_opt subset_memo (p1.id, p2.id) with
+      |Some b -> b
+      |None ->
+        let b = bv_subset p1.bits p2.bits in
+        if Hashtbl.length subset_memo >= subset_memo_limit then Hashtbl.reset subset_memo;
+        Hashtbl.add subset_memo (p1.id, p2.id) b;
+        b;;
+
+let print p = fold (fun i s -> Printf.sprintf "%s%d," s i) p.bits "";;
+
+(*
+  - group the transitions of phi by alphabet class (see Nfa.class_count), each class getting the union of its targets
+  - returns the runs of adjacent classes with the same targets as (first class, last class, working set) in
+    ascending order, classes without any transition have an empty working set
+*)
+let step nfa p =
+  let n = Nfa.size nfa in
+  let targets = Array.make (Nfa.class_count nfa) [||] in
+  fold (fun i () ->
+    List.iter (fun (cu, cv, j) ->
+      for k = cu to cv do
+        if Array.length targets.(k) == 0 then targets.(k) <- bv_create n;
+        bv_add targets.(k) j
+      done
+    ) (Nfa.get_class_transitions nfa i)
+  ) p.bits ();
+  let rec collect k lst = if k < 0 then lst else
+    match lst with
+      |(_, cv, bv) :: t when bv = targets.(k) -> collect (k - 1) ((k, cv, bv) :: t)
+      |_ -> collect (k - 1) ((k, k, targets.(k)) :: lst) in
+  collect (Array.length targets - 1) [];;
+
+(* character range covered by a run of classes *)
+let run_range nfa (cu, cv, _) = (fst (Nfa.class_range nfa cu), snd (Nfa.class_range nfa cv));;
+
+(* the phis reached by each run of classes, along with the corresponding prefixes *)
+let collect_phis nfa w runs =
+  List.fold_right (fun run lst -> match run with
+    |(_, _, bv) when Array.length bv == 0 -> lst
+    |(_, _, bv) -> (Word.extend w (run_range nfa run), intern (pack bv)) :: lst
+  ) runs [];;
+
+let advance (nfa, w, p) = collect_phis nfa w (step nfa p);;
 
 (* same as above, but also compute the characters which can fail the current phi entirely *)
 let explore (nfa, w, p) =
-  let tr = IntSet.fold (fun i tr -> List.fold_left (fun tr (u, v, j) -> itr_add tr u v (IntSet.singleton j)) tr (Nfa.get_transitions nfa i)) p ITNull in
-  (itr_collect tr w [], itr_find_nomatch tr);;
+  let runs = step nfa p in
+  let nomatch = List.fold_right (fun run lst -> match run with
+    |(_, _, bv) when Array.length bv == 0 ->
+      let (u, v) = run_range nfa run in
+      if u <= zmax then (u, min v zmax) :: lst else lst
+    |_ -> lst
+  ) runs [] in
+  (collect_phis nfa w runs, nomatch);;
 
 let evolve (nfa, w, p) iopt =
   let flgs = ref Flags.empty in
-  let rec evolve pl st ep = match pl with
-    |[] -> (!flgs, ep)
-    |i :: t when IntSet.mem i st -> evolve t st ep (* already represented in ep, ignore *)
-    |i :: t ->
-      let st = IntSet.add i st in
-      match Nfa.get_state nfa i with
-        |End ->
-          flgs := Flags.set_accepting !flgs; (* accepting state reached *)
-          evolve t st (IntSet.add i ep)
-        |Kill -> evolve t st ep
-        |Pass j -> evolve (j :: t) st ep
-        |MakeB j -> evolve (j :: t) st ep
-        |EvalB j -> evolve (j :: t) st ep
-        |BeginCap (_, j) -> evolve (j :: t ) st ep
-        |EndCap (_, j) -> evolve (j :: t ) st ep
-        |Match _ -> evolve t st (IntSet.add i ep) (* fully evolved *)
-        |CheckPred (P_BOI, j) ->
-          if Word.is_empty w then evolve (j :: t) st ep else evolve t st ep
-        |CheckPred (P_BOL ulines, j) ->
-          begin
-            match Word.tail w with
-              |None -> evolve (j :: t) st ep
-              |Some ((u, v), _) when u <= '\n' && '\n' <= v -> evolve (j :: t) st ep
-              |Some ((u, v), _) when ulines && u <= '\r' && '\r' <= v -> evolve (j :: t) st ep
-              |_ -> evolve t st ep
-          end
-        |CheckPred (P_EOI, _) ->
-          flgs := Flags.set_eoihit !flgs;
-          evolve t st (IntSet.add i ep)
-        |CheckPred _ |CheckBackref _ ->
-          flgs := Flags.set_interrupted !flgs;
-          evolve t st ep
-        |BranchAlt (j, k) ->
-          evolve (j :: k :: t) st ep
-        |BranchKln (_, j, k) ->
-          let _ = match iopt with
-            |None -> ()
-            |Some ik ->
-              (* check if this is the kleene we're interested in *)
-              flgs := if ik == i then Flags.set_klnhit !flgs else !flgs in
-          evolve (j :: k :: t) st ep in
-  (* convert phi to a list of integers so that we can pattern match *)
-  evolve (IntSet.fold (fun i l -> i :: l) p []) IntSet.empty IntSet.empty;;
+  (* closure states visited so far / the evolved phi *)
+  let st = bv_create (Nfa.size nfa) in
+  let ep = bv_create (Nfa.size nfa) in
+  let rec close i = Array.iter (fun k -> if not (bv_mem st k) then (bv_add st k; visit k)) (Nfa.get_closure nfa i)
+  and visit i = match Nfa.get_state nfa i with
+    |End ->
+      flgs := Flags.set_accepting !flgs; (* accepting state reached *)
+      bv_add ep i
+    |Match _ -> bv_add ep i (* fully evolved *)
+    |CheckPred (P_BOI, j) ->
+      if Word.is_empty w then close j
+    |CheckPred (P_BOL ulines, j) ->
+      begin
+        match Word.tail w with
+          |None -> close j
+          |Some ((u, v), _) when u <= '\n' && '\n' <= v -> close j
+          |Some ((u, v), _) when ulines && u <= '\r' && '\r' <= v -> close j
+          |_ -> ()
+      end
+    |CheckPred (P_EOI, _) ->
+      flgs := Flags.set_eoihit !flgs;
+      bv_add ep i
+    |CheckPred _ |CheckBackref _ ->
+      flgs := Flags.set_interrupted !flgs
+    |BranchKln _ ->
+      begin
+        match iopt with
+          |None -> ()
+          |Some ik ->
+            (* check if this is the kleene we're interested in *)
+            flgs := if ik == i then Flags.set_klnhit !flgs else !flgs
+      end
+    (* epsilon moves are taken care of by the closures *)
+    |Kill |Pass _ |MakeB _ |EvalB _ |BeginCap _ |EndCap _ |BranchAlt _ -> () in
+  fold (fun i () -> close i) p.bits ();
+  (!flgs, intern (pack ep));;
 
 (* utility method for checking if the given character class includes the target character *)
 let rec matches cls c = match cls with
@@ -117,41 +194,31 @@ let rec matches cls c = match cls with
 (* simulate phi against the given character *)
 let chr_simulate (nfa, w, p) c =
   let flgs = ref Flags.empty in
-  let rec simulate l st rp = match l with
-    (* return flags as well as the updated prefix *)
-    |[] -> (!flgs, Word.extend w (c, c), rp)
-    |i :: t when IntSet.mem i st -> simulate t st rp
-    |i :: t ->
-      let st = IntSet.add i st in
-      match Nfa.get_state nfa i with
-        |End |Kill -> simulate t st rp
-        |Pass j -> simulate (j :: t) st rp
-        |MakeB j -> simulate (j :: t) st rp
-        |EvalB j -> simulate (j :: t) st rp
-        |BeginCap (_, j) -> simulate (j :: t) st rp
-        |EndCap (_, j) -> simulate (j :: t) st rp
-        (* this is where the matching / failing happens *)
-        |Match (cls, j) -> if matches cls c then simulate t st (IntSet.add j rp) else simulate t st rp
-        |CheckPred (P_BOI, j) ->
-          if Word.is_empty w then simulate (j :: t) st rp else simulate t st rp
-        |CheckPred (P_BOL ulines, j) ->
-          begin
-            match Word.tail w with
-              |None -> simulate (j :: t) st rp
-              |Some ((u, v), _) when u <= '\n' && '\n' <= v -> simulate (j :: t) st rp
-              |Some ((u, v), _) when ulines && u <= '\r' && '\r' <= v -> simulate (j :: t) st rp
-              |_ -> simulate t st rp
-          end
-        |CheckPred (P_EOI, _) -> simulate t st rp
-        |CheckPred _ |CheckBackref _ ->
-          flgs := Flags.set_interrupted !flgs;
-          simulate t st rp
-        |BranchAlt (j, k) ->
-          simulate (j :: k :: t) st rp
-        |BranchKln (_, j, k) ->
-          simulate (j :: k :: t) st rp in
-  (* convert phi to a list of integers so that we can pattern match *)
-  simulate (IntSet.fold (fun i l -> i :: l) p []) IntSet.empty IntSet.empty;;
+  (* closure states visited so far / the resulting phi *)
+  let st = bv_create (Nfa.size nfa) in
+  let rp = bv_create (Nfa.size nfa) in
+  let rec close i = Array.iter (fun k -> if not (bv_mem st k) then (bv_add st k; visit k)) (Nfa.get_closure nfa i)
+  and visit i = match Nfa.get_state nfa i with
+    (* this is where the matching / failing happens *)
+    |Match (cls, j) -> if matches cls c then bv_add rp j
+    |CheckPred (P_BOI, j) ->
+      if Word.is_empty w then close j
+    |CheckPred (P_BOL ulines, j) ->
+      begin
+        match Word.tail w with
+          |None -> close j
+          |Some ((u, v), _) when u <= '\n' && '\n' <= v -> close j
+          |Some ((u, v), _) when ulines && u <= '\r' && '\r' <= v -> close j
+          |_ -> ()
+      end
+    |CheckPred (P_EOI, _) -> ()
+    |CheckPred _ |CheckBackref _ ->
+      flgs := Flags.set_interrupted !flgs
+    (* epsilon moves are taken care of by the closures *)
+    |End |Kill |Pass _ |MakeB _ |EvalB _ |BeginCap _ |EndCap _ |BranchAlt _ |BranchKln _ -> () in
+  fold (fun i () -> close i) p.bits ();
+  (* return flags as well as the updated prefix *)
+  (!flgs, Word.extend w (c, c), intern (pack rp));;
 
 let simulate (nfa, w, p) cl =
   (* simulate the phi character-by-character *)
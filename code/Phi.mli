@@ -2,7 +2,7 @@
 
 open Common
 
-(* internal representation of phi *)
+(* internal representation of phi - a hash-consed, packed bitset of states *)
 type t;;
 
 module PhiSet : (Set.S with type elt = t);;
@@ -13,10 +13,17 @@ val make : IntSet.t -> t;;
 (* extract elements of phi *)
 val elems : t -> IntSet.t;;
 
-(* compare two phis *)
+(* unique id of a phi, equal phis have the same id as long as one of them is alive *)
+val id : t -> int;;
+
+(* compare two phis (by id, constant time) *)
 val compare : t -> t -> int;;
 
-(* check if the first phi is a subset of the second *)
+(* equality / hash of phis, consistent with compare *)
+val equal : t -> t -> bool;;
+val hash : t -> int;;
+
+(* check if the first phi is a subset of the second (memoized on the ids) *)
 val subset : t -> t -> bool;;
 
 (* formatting a phi for output *)
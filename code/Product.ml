@@ -3,20 +3,36 @@
 open Common
 open Nfa
 
-(* an NFA state and a phi *)
-type t = (int * Phi.t);;
+(* an NFA state and a phi, hash-consed with a unique id *)
+type t = {id : int; state : int; phi : Phi.t};;
+
+(* the interned products, entries go away once the products are no longer referenced *)
+module Interned = Weak.Make (
+  struct
+    type nonrec t = t;;
+    (* phis are hash-consed themselves *)
+    let equal p1 p2 = p1.state == p2.state && Phi.equal p1.phi p2.phi;;
+    let hash p = Hashtbl.hash (p.state, Phi.hash p.phi);;
+  end);;
+
+let interned = Interned.create 4096;;
+let next_id = ref 0;;
 
 module ProductSet = Set.Make (
   struct
-    type t = (int * Phi.t);;
-    let compare (i1, p1) (i2, p2) =
-      let ic = Stdlib.compare i1 i2 in
-      if ic == 0 then Phi.compare p1 p2 else ic;;
+    type nonrec t = t;;
+    let compare p1 p2 = Stdlib.compare p1.id p2.id;;
   end);;
 
-let make i p = (i, p);;
+let make i p =
+  let q = {id = !next_id; state = i; phi = p} in
+  let r = Interned.merge interned q in
+  if r == q then next_id := !next_id + 1;
+  r;;
+
+let id p = p.id;;
 
-let elems (i, p) = (i, p);;
+let elems p = (p.state, p.phi);;
 
 (* a sorted tree of two parallel transitions *)
 type ptree = PTNull | PTNode of char * char * IntSet.t * IntSet.t * ptree * ptree;;
@@ -38,10 +54,11 @@ let rec ptr_collect tr w lst = match tr with
     (* phi is the entire second set of states *)
     let p = Phi.make s2 in
     (* each state on the first set gives rise to a new product *)
-    let lst = IntSet.fold (fun i l -> (Word.extend w (u, v), (i, p)) :: l) s1 lst in
+    let lst = IntSet.fold (fun i l -> (Word.extend w (u, v), make i p) :: l) s1 lst in
     ptr_collect rtr w (ptr_collect ltr w lst);;
 
-let advance (nfa, w, (i, p)) =
+let advance (nfa, w, q) =
+  let (i, p) = elems q in
   (* begin with all the transitions of the first NFA state *)
   let tr = List.fold_left (
     fun tr (u, v, j) -> ptr_add tr u v (IntSet.singleton j) IntSet.empty
@@ -55,14 +72,15 @@ let advance (nfa, w, (i, p)) =
   (* all the NFA transitions and the phis are now grouped in the tree *)
   ptr_collect tr w [];;
 
-let evolve (nfa, w, (i, p)) brset =
+let evolve (nfa, w, q) brset =
+  let (i, p) = elems q in
   (* evolve the phi component *)
   let (flgs, ep) = Phi.evolve (nfa, w, p) None in
   let flgs = ref flgs in
   (* explore the NFA state looking for branch points *)
   let rec evolve pl st tpl = match pl with
     (* return the evolved product (the NFA component is left untouched) and the resulting triples *)
-    |[] -> (!flgs, (i, ep), tpl) 
+    |[] -> (!flgs, make i ep, tpl)
     |i :: t when IntSet.mem i st -> evolve t st tpl (* already explored, ignore *)
     |i :: t ->
       let st = IntSet.add i st in
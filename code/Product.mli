@@ -2,7 +2,7 @@
 
 open Common
 
-(* internal product representation *)
+(* internal product representation - hash-consed *)
 type t;;
 
 module ProductSet : (Set.S with type elt = t);;
@@ -10,6 +10,9 @@ module ProductSet : (Set.S with type elt = t);;
 (* make a new product with an NFA state and a phi *)
 val make : int -> Phi.t -> t;;
 
+(* unique id of a product, equal products have the same id as long as one of them is alive *)
+val id : t -> int;;
+
 (* extract elements of a product *)
 val elems : t -> (int * Phi.t);;
 
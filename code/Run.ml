@@ -67,6 +67,7 @@ let print_nfa nfa =
 
 let print_flags f =
   let s = if Flags.is_interrupted f then "INTERRUPTED, " else "" in
+  let s = if Flags.is_timeout f then Printf.sprintf "%sTIMEOUT, " s else s in
   if Flags.is_pruned f then Printf.sprintf "%sPRUNED" s else s;;
 
 let std_scan _ =
@@ -85,7 +86,7 @@ let std_scan _ =
     begin
       (*match AnalyserMain.search_exhaustive nfa with*)
       let ts = Unix.gettimeofday () in
-      match AnalyserMain.search_optimized nfa slim with
+      match AnalyserMain.search_optimized nfa slim (Budget.unlimited ()) with
         |(f, _, None) -> Printf.printf "None.\nF : {%s}\nT : %f (s)\n" (print_flags f) (Unix.gettimeofday () -. ts)
         |(f, _, Some (ik, x, y, z)) -> Printf.printf "KLEENE: %d\nPREFIX : %s\nPUMPABLE : %s\nSUFFIX : %s\nFLAGS : {%s}\nTIME : %f (s)\n"
           ik (Word.print x) (Word.print y) (Word.print z) (print_flags f) (Unix.gettimeofday () -. ts)
@@ -95,7 +96,100 @@ let std_scan _ =
     flush stdout
   done;;
 
-let batch_scan fname zlim =
+(* analysis of a single nfa (runs in the worker processes with -j), returns the flags, whether there are
+   pumpable kleene, the attack string (if any) and the analysis time *)
+let analyse_nfa (nfa, zlim, secs) =
+  let ts = Unix.gettimeofday () in
+  let (f, kset, r) = AnalyserMain.search_optimized nfa zlim (Budget.make secs 0) in
+  (f, IntSet.is_empty kset, r, Unix.gettimeofday () -. ts);;
+
+(* the outcome of an earlier analysis handed out again for a duplicate input, which took no time of its own *)
+let reused outcome = match outcome with
+  |Ok (f, knone, r, _) -> Ok (f, knone, r, 0.0)
+  |Error msg -> Error msg;;
+
+(*
+  - next () produces the input items (None at the end), each of which is some tag plus an optional analysis job
+    along with the key (regex string) identifying it
+  - emit is invoked with each tag and the outcome of its job (Ok result or Error message) in input order
+  - jobs with the same key as an earlier one are not analysed again, they get the outcome of the first one
+  - with more than one job the analyses run on that many worker processes, at most 4 items per worker are buffered
+*)
+let ordered_scan jobs next emit =
+  let run job = try Ok (analyse_nfa job) with e -> Error (Printexc.to_string e) in
+  (* outcome (slot) of the first job with each key *)
+  let firsts = Hashtbl.create 1024 in
+  if jobs <= 1 then
+    let rec scan () = match next () with
+      |None -> ()
+      |Some (tag, None) -> emit tag None; scan ()
+      |Some (tag, Some (key, job)) ->
+        begin
+          match Hashtbl.find_opt firsts key with
+            |Some {contents = Some outcome} -> emit tag (Some (reused outcome))
+            |_ ->
+              let outcome = run job in
+              Hashtbl.replace firsts key (ref (Some outcome));
+              emit tag (Some outcome)
+        end;
+        scan () in
+    scan ()
+  else (
+    let workers = List.init jobs (fun _ -> Workers.spawn analyse_nfa) in
+    (* items in input order, each with a slot for the outcome (shared by duplicates) and whether it has a job *)
+    let pending = Queue.create () in
+    let idle = ref workers in
+    let busy = ref [] in
+    let eoi = ref false in
+    let rec feed () = match !idle with
+      |w :: t when not !eoi && Queue.length pending < 4 * jobs ->
+        begin
+          match next () with
+            |None -> eoi := true
+            |Some (tag, None) -> Queue.push (tag, ref None, `None) pending
+            |Some (tag, Some (key, job)) ->
+              begin
+                match Hashtbl.find_opt firsts key with
+                  |Some slot -> Queue.push (tag, slot, `Duplicate) pending
+                  |None ->
+                    let slot = ref None in
+                    Hashtbl.add firsts key slot;
+                    Queue.push (tag, slot, `Job) pending;
+                    Workers.send w job;
+                    idle := t;
+                    busy := (w, slot) :: !busy
+              end
+        end;
+        feed ()
+      |_ -> () in
+    let rec drain () =
+      if not (Queue.is_empty pending) then
+        match Queue.peek pending with
+          |(tag, slot, `None) -> ignore (Queue.pop pending); emit tag !slot; drain ()
+          |(tag, {contents = Some r}, `Job) -> ignore (Queue.pop pending); emit tag (Some r); drain ()
+          |(tag, {contents = Some r}, `Duplicate) -> ignore (Queue.pop pending); emit tag (Some (reused r)); drain ()
+          |(_, {contents = None}, _) -> () in
+    let rec collect () =
+      feed ();
+      drain ();
+      match !busy with
+        |[] when !eoi -> ()
+        |[] -> collect ()
+        |_ ->
+          let fds = List.map (fun (w, _) -> Workers.response_fd w) !busy in
+          let (ready, _, _) = try Unix.select fds [] [] (-1.0) with Unix.Unix_error (Unix.EINTR, _, _) -> ([], [], []) in
+          let (done_, running) = List.partition (fun (w, _) -> List.mem (Workers.response_fd w) ready) !busy in
+          List.iter (fun (w, slot) ->
+            slot := Some (Workers.receive w);
+            idle := w :: !idle
+          ) done_;
+          busy := running;
+          collect () in
+    collect ();
+    List.iter Workers.stop workers
+  );;
+
+let batch_scan fname zlim secs jobs =
   let rs = RegexScanner.make fname in
   let c_total = ref 0 in
   let c_parsed = ref 0 in
@@ -103,29 +197,24 @@ let batch_scan fname zlim =
   let c_vulnerable = ref 0 in
   let c_interrupted = ref 0 in
   let c_pruned = ref 0 in
+  let c_timeout = ref 0 in
   let t_total = ref 0.0 in
   let t_max = ref 0.0 in
   let s_max = ref 0 in
   let s_total = ref 0 in
-  let rec scan () = match RegexScanner.next rs with
-    |RegexScanner.Eof ->
-      Printf.printf ">> TOTAL: %d\n" !c_total;
-      Printf.printf ">> PARSED: %d\n" !c_parsed;
-      Printf.printf ">> MAX NFA SIZE: %d\n" !s_max;
-      Printf.printf ">> AVG NFA SIZE: %d\n" (!s_total / !c_parsed);
-      Printf.printf ">> PUMPABLE: %d\n" !c_pumpable;
-      Printf.printf ">> VULNERABLE: %d\n" !c_vulnerable;
-      Printf.printf ">> INTERRUPTED: %d\n" !c_interrupted;
-      Printf.printf ">> PRUNED: %d\n" !c_pruned;
-      Printf.printf ">> TIME TOTAL: %f (s)\n" !t_total;
-      Printf.printf ">> TIME MAX: %f (s)\n" !t_max;
-    |RegexScanner.Error (e, s) ->
+  let next () = match RegexScanner.next rs with
+    |RegexScanner.Eof -> None
+    |RegexScanner.Error (e, s) -> Some ((s, Error e), None)
+    |RegexScanner.Regex (nfa, s) -> Some ((s, Ok nfa), Some (s, (nfa, zlim, secs))) in
+  let emit (s, parsed) outcome = match (parsed, outcome) with
+    |(Error e, _) ->
       c_total := !c_total + 1;
       Printf.printf "= [%d] =\n" !c_total;
       Printf.printf "INPUT: %s\n" s;
-      Printf.printf "PARSE: ERROR {%s}\n%!" (Printexc.to_string e);
-      scan ()
-    |RegexScanner.Regex (nfa, s) ->
+      Printf.printf "PARSE: ERROR {%s}\n%!" (Printexc.to_string e)
+    |(Ok _, None) -> ()
+    |(Ok _, Some (Error msg)) -> failwith msg
+    |(Ok nfa, Some (Ok (f, knone, r, t_this))) ->
       c_total := !c_total + 1;
       c_parsed := !c_parsed + 1;
       s_total := !s_total + (Nfa.size nfa);
@@ -135,11 +224,9 @@ let batch_scan fname zlim =
       Printf.printf "PARSE: OK\n";
       Printf.printf "SIZE: %d\n%!" (Nfa.size nfa);
       begin
-        let ts = Unix.gettimeofday () in
-        match AnalyserMain.search_optimized nfa zlim with
-          |(f, kset, None) ->
-            let t_this = Unix.gettimeofday () -. ts in
-            let _ = if IntSet.is_empty kset then (
+        match r with
+          |None ->
+            let _ = if knone then (
               Printf.printf "PUMPABLE: NO\n"
             ) else (
               c_pumpable := !c_pumpable + 1;
@@ -148,10 +235,11 @@ let batch_scan fname zlim =
             ) in
             c_interrupted := if Flags.is_interrupted f then !c_interrupted + 1 else !c_interrupted;
             c_pruned := if Flags.is_pruned f then !c_pruned + 1 else !c_pruned;
+            c_timeout := if Flags.is_timeout f then !c_timeout + 1 else !c_timeout;
             t_total := !t_total +. t_this;
             t_max := if t_this > !t_max then t_this else !t_max;
             Printf.printf "TIME: %f (s)\n" t_this
-          |(f, _, Some (ik, x, y, z)) ->
+          |Some (ik, x, y, z) ->
             c_pumpable := !c_pumpable + 1;
             c_vulnerable := !c_vulnerable + 1;
             c_pruned := if Flags.is_pruned f then !c_pruned + 1 else !c_pruned;
@@ -161,63 +249,84 @@ let batch_scan fname zlim =
             Printf.printf "PREFIX: %s\n" (Word.print_select x [('\x21', '\x7e')]);
             Printf.printf "PUMPABLE: %s\n" (Word.print_select y [('\x21', '\x7e')]);
             Printf.printf "SUFFIX: %s\n" (Word.print_select z [('\x21', '\x7e')]);
-            Printf.printf "TIME: %f (s)\n" (Unix.gettimeofday () -. ts)
-      end;
-      scan () in
-  scan ();;
+            Printf.printf "TIME: %f (s)\n" t_this
+      end in
+  ordered_scan jobs next emit;
+  Printf.printf ">> TOTAL: %d\n" !c_total;
+  Printf.printf ">> PARSED: %d\n" !c_parsed;
+  Printf.printf ">> MAX NFA SIZE: %d\n" !s_max;
+  Printf.printf ">> AVG NFA SIZE: %d\n" (!s_total / !c_parsed);
+  Printf.printf ">> PUMPABLE: %d\n" !c_pumpable;
+  Printf.printf ">> VULNERABLE: %d\n" !c_vulnerable;
+  Printf.printf ">> INTERRUPTED: %d\n" !c_interrupted;
+  Printf.printf ">> PRUNED: %d\n" !c_pruned;
+  Printf.printf ">> TIMEOUT: %d\n" !c_timeout;
+  Printf.printf ">> TIME TOTAL: %f (s)\n" !t_total;
+  Printf.printf ">> TIME MAX: %f (s)\n" !t_max;;
 
-let snort_scan fname slim qmode =
+let snort_scan fname slim qmode secs jobs =
   let rs = RuleScanner.make fname in
   let total_regexes = ref 0 in
   let analysed_regexes = ref 0 in
   let vulnerable_regexes = ref 0 in
   let unknown_regexes = ref 0 in
   let current_file = ref "" in
-  let rec scan () = match RuleScanner.next rs with
-    |None -> Printf.printf "TOTAL: %d\nANALYSED: %d\nVULNERABLE: %d\nUNKNOWN: %d\n" !total_regexes !analysed_regexes !vulnerable_regexes !unknown_regexes
+  (* parsing happens here, the analysis in ordered_scan *)
+  let next () = match RuleScanner.next rs with
+    |None -> None
     |Some (file, line, regex_string) ->
-      total_regexes := !total_regexes + 1;
-      if (!current_file != file) then (
-        current_file := file;
-        Printf.printf "Processing file: %s\n" file
-      );
       let lexbuf = Lexing.from_string (Printf.sprintf "%s\n" regex_string) in
       try
         let p = ParsingMain.parse_pattern lexbuf in
         let nfa = Nfa.make p in
+        Some ((file, line, regex_string, Ok nfa), Some (regex_string, (nfa, slim, secs)))
+      with e ->
+        Some ((file, line, regex_string, Error (Printexc.to_string e)), None) in
+  let emit (file, line, regex_string, parsed) outcome =
+    total_regexes := !total_regexes + 1;
+    if (!current_file != file) then (
+      current_file := file;
+      Printf.printf "Processing file: %s\n" file
+    );
+    match (parsed, outcome) with
+      |(Error msg, _) | (Ok _, Some (Error msg)) ->
+        unknown_regexes := !unknown_regexes + 1;
+        if not qmode then Printf.printf "Line: %d, Parsing error (%s)\n" line msg
+      |(Ok _, None) -> ()
+      |(Ok nfa, Some (Ok (f, _, r, _))) ->
         begin
-          match AnalyserMain.search_optimized nfa slim with
-            |(f, _, None) when (Flags.is_empty f) -> ()
-            |(f, _, None) ->
+          match r with
+            |None when (Flags.is_empty f) -> ()
+            |None ->
               unknown_regexes := !unknown_regexes + 1;
               Printf.printf "Line: %d, Flags : {%s}\n%!" line (print_flags f)
-            |(f, _, Some (ik, x, y, z)) -> 
+            |Some (ik, x, y, z) ->
               vulnerable_regexes := !vulnerable_regexes + 1;
               let (ks, ke) = Nfa.get_subexp_location nfa ik in
               Printf.printf "Line: %d\n  KLEENE: %s\n  PREFIX : %s\n  PUMPABLE : %s\n  SUFFIX : %s\n  FLAGS : {%s}\n%!"
                 line (String.sub regex_string (ks + 1) (ke - ks + 1)) (Word.print x) (Word.print y) (Word.print z) (print_flags f)
         end;
-        analysed_regexes := !analysed_regexes + 1;
-        scan ()
-      with e ->
-        unknown_regexes := !unknown_regexes + 1;
-        if not qmode then Printf.printf "Line: %d, Parsing error (%s)\n%!" line (Printexc.to_string e);
-        scan () in
-  scan ();;
+        analysed_regexes := !analysed_regexes + 1 in
+  ordered_scan jobs next emit;
+  Printf.printf "TOTAL: %d\nANALYSED: %d\nVULNERABLE: %d\nUNKNOWN: %d\n" !total_regexes !analysed_regexes !vulnerable_regexes !unknown_regexes;;
 
 let slim = ref 100 in (* default z search limit, rarely touched *)
 let input_file = ref None in
 let snort_mode = ref false in
 let quiet_mode = ref false in
+let timeout = ref 0.0 in (* per-regex analysis budget in seconds, no limit by default *)
+let jobs = ref 1 in (* number of worker processes *)
 let spec = Arg.align [("-slim", Arg.Int (fun i -> if i > 1 then slim := i), "<n> Abandon current search path after this many unstable xy derivations");
             ("-i", Arg.String (fun s -> input_file := Some s), "<file> Analyse regular expressions from this input file");
+            ("-timeout", Arg.Float (fun t -> timeout := t), "<secs> Give up the analysis of a regular expression after this long (reported as TIMEOUT)");
+            ("-j", Arg.Int (fun j -> jobs := if j > 0 then j else Workers.cpu_count ()), "<n> Analyse on this many worker processes (0 means one per processor), results are still printed in input order");
             ("-q", Arg.Unit (fun () -> quiet_mode := true), " Quiet mode (hide parsing erros)");
             ("-snort", Arg.Unit (fun () -> snort_mode := true), " Snort rule processing mode (use -i to specify the rules file / directory)")] in
-let message = "USAGE: run.bin [-slim n] [-i file] [-snort]" in
+let message = "USAGE: run.bin [-slim n] [-timeout secs] [-j n] [-i file] [-snort]" in
 let _ = Arg.parse spec (fun _ -> ()) message in
 match !input_file with
-  |Some f when !snort_mode -> snort_scan f !slim !quiet_mode 
-  |Some f -> batch_scan f !slim
+  |Some f when !snort_mode -> snort_scan f !slim !quiet_mode !timeout !jobs
+  |Some f -> batch_scan f !slim !timeout !jobs
   |None -> 
     if !snort_mode then
       Arg.usage spec message
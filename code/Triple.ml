@@ -2,18 +2,36 @@
 
 open Common
 
-(* internal representation - an NFA state pair and a phi *)
-type t = (int * int) * Phi.t;;
+(* internal representation - an NFA state pair and a phi, hash-consed with a unique id *)
+type t = {id : int; pair : int * int; phi : Phi.t};;
+
+(* the interned triples, entries go away once the triples are no longer referenced *)
+module Interned = Weak.Make (
+  struct
+    type nonrec t = t;;
+    (* phis are hash-consed themselves *)
+    let equal t1 t2 = t1.pair = t2.pair && Phi.equal t1.phi t2.phi;;
+    let hash t = Hashtbl.hash (t.pair, Phi.hash t.phi);;
+  end);;
+
+let interned = Interned.create 4096;;
+let next_id = ref 0;;
 
 module TripleSet = Set.Make (
   struct
-    type t = (int * int) * Phi.t;;
-    let compare (i1, p1) (i2, p2) = let c = Stdlib.compare i1 i2 in if c == 0 then Phi.compare p1 p2 else c;; 
+    type nonrec t = t;;
+    let compare t1 t2 = Stdlib.compare t1.id t2.id;;
   end);;
 
-let make i j p = ((i, j), p);;
+let make i j p =
+  let t = {id = !next_id; pair = (i, j); phi = p} in
+  let u = Interned.merge interned t in
+  if u == t then next_id := !next_id + 1;
+  u;;
+
+let id t = t.id;;
 
-let elems ((i, j), p) = (i, j, p);;
+let elems t = let (i, j) = t.pair in (i, j, t.phi);;
 
 (* a sorted tree of three parallel transitions (corresponding to two NFAs and a phi) *)
 type ttree = TTNull | TTNode of char * char * IntSet.t * IntSet.t * IntSet.t * ttree * ttree;;
@@ -40,12 +58,13 @@ let rec ttr_collect tr w lst = match tr with
     *)
     let lst = IntSet.fold (fun i l ->
       IntSet.fold (fun j l ->
-        (Word.extend w (u, v), ((min i j, max i j), p)) :: l
+        (Word.extend w (u, v), make (min i j) (max i j) p) :: l
       ) s2 l
     ) s1 lst in
     ttr_collect rtr w (ttr_collect ltr w lst);;
 
-let advance (nfa, w, ((i, j), p)) =
+let advance (nfa, w, t) =
+  let (i, j, p) = elems t in
   (* begin with all the transitions of the first NFA *)
   let tr = List.fold_left (
     fun tr (u, v, k) -> ttr_add tr u v (IntSet.singleton k) IntSet.empty IntSet.empty
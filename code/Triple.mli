@@ -1,6 +1,6 @@
 (* © Copyright University of Birmingham, UK *)
 
-(* internal representation of a triple *)
+(* internal representation of a triple - hash-consed *)
 type t;;
 
 module TripleSet : (Set.S with type elt = t);;
@@ -8,6 +8,9 @@ module TripleSet : (Set.S with type elt = t);;
 (* make a triple consisting of two parallel NFA states and a phi *)
 val make : int -> int -> Phi.t -> t;;
 
+(* unique id of a triple, equal triples have the same id as long as one of them is alive *)
+val id : t -> int;;
+
 (* extract elements of a triple *)
 val elems : t -> int * int * Phi.t;;
 
@@ -46,32 +46,25 @@ let find_branches nfa ik =
     |_ -> [];;
 
 let is_epsilon_reachable nfa w src dst =
-  let rec explore i st = match i with
-    |i when i == dst -> true
-    |i when IntSet.mem i st -> false
-    |_ ->
-      let st = IntSet.add i st in
-      match Nfa.get_state nfa i with
-        End | Kill | Match _ -> false
-        |Pass j -> explore j st
-        |MakeB j -> explore j st
-        |EvalB j -> explore j st
-        |CheckPred (P_BOI, j) -> if Word.is_empty w then explore j st else false
+  (* predicates already followed *)
+  let st = ref IntSet.empty in
+  let rec explore i = i == dst || Array.exists (fun k -> k == dst || follow k) (Nfa.get_closure nfa i)
+  and follow k =
+    if IntSet.mem k !st then false else (
+      st := IntSet.add k !st;
+      match Nfa.get_state nfa k with
+        |CheckPred (P_BOI, j) -> Word.is_empty w && explore j
         |CheckPred (P_BOL ulines, j) ->
           begin
             match Word.tail w with
-              |None -> explore j st
-              |Some ((u, v),  _) when u <= '\n' && '\n' <= v -> explore j st
-              |Some ((u, v),  _) when ulines && u <= '\r' && '\r' <= v -> explore j st
+              |None -> explore j
+              |Some ((u, v),  _) when u <= '\n' && '\n' <= v -> explore j
+              |Some ((u, v),  _) when ulines && u <= '\r' && '\r' <= v -> explore j
               |_ -> false
           end
-        |CheckPred _ -> false (* not supported *)
-        |CheckBackref _ -> false (* not supported *)
-        |BeginCap (_, j) -> explore j st
-        |EndCap (_, j) -> explore j st
-        |BranchAlt (j, k) -> explore j st || explore k st
-        |BranchKln (_, j, k) -> explore j st || explore k st in
-  explore src IntSet.empty;;
+        |_ -> false (* not an epsilon move, other predicates are not supported *)
+    ) in
+  explore src;;
 
 (* a sorted tree of state vector pairs *)
 type xtree = XTNull | XTNode of char * char * int list * int list * xtree * xtree;;
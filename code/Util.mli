@@ -2,7 +2,7 @@
 
 open Common
 
-(* check epsilon reachability, word argument is used for evaluating predicates only *)
+(* check epsilon reachability of a kleene (or any other non-epsilon) state, word argument is used for evaluating predicates only *)
 val is_epsilon_reachable : Nfa.t -> Word.t -> int -> int -> bool;;
 
 (* find pumpable kleene nodes, along with the corresponding branch points *)
@@ -2,32 +2,64 @@
 
 open Common
 
-(* a list of character ranges - stored in reverse order *)
-type t = (char * char) list;;
+(*
+  - a rope of character ranges (in order), each concatenation node caching its length
+  - Empty never appears inside a concatenation
+*)
+type t =
+  |Empty
+  |Chr of (char * char)
+  |Cat of int * t * t;;
 
-let empty = [];;
+let empty = Empty;;
 
 let is_empty w = match w with
-  |[] -> true
+  |Empty -> true
   |_ -> false;;
 
-let extend w cc = cc :: w;;
+let length w = match w with
+  |Empty -> 0
+  |Chr _ -> 1
+  |Cat (n, _, _) -> n;;
 
-let append w1 w2 = w2 @ w1;;
+let cat w1 w2 = match (w1, w2) with
+  |(Empty, _) -> w2
+  |(_, Empty) -> w1
+  |_ -> Cat (length w1 + length w2, w1, w2);;
 
-let length w = List.length w;;
+let extend w cc = cat w (Chr cc);;
 
-let tail w = match w with
-  |[] -> None
-  |(u, v) :: t -> Some ((u, v), t);;
+let append w1 w2 = cat w1 w2;;
+
+(* visit the ranges from left to right, without recursing on the (possibly deep) left spine *)
+let iter f w =
+  let rec walk l = match l with
+    |[] -> ()
+    |Empty :: t -> walk t
+    |Chr cc :: t -> f cc; walk t
+    |Cat (_, w1, w2) :: t -> walk (w1 :: w2 :: t) in
+  walk [w];;
+
+(* concatenate a list of words, the last one given first *)
+let concat_rev l = List.fold_left (fun w p -> cat p w) Empty l;;
+
+let tail w =
+  (* words are mostly built by extending, so the last range tends to hang right off the root *)
+  let rec last w l = match w with
+    |Empty -> None
+    |Chr cc -> Some (cc, concat_rev l)
+    |Cat (_, w1, w2) -> last w2 (w1 :: l) in
+  last w [];;
 
 let suffix w flen =
-  let tlen = length w in
-  let rec suffix w i = match (w, i) with
-    |(_, i) when i == flen -> []
-    |(h :: t, i) -> h :: suffix t (i - 1)
-    |_ -> [] in
-  if flen >= tlen then [] else suffix w tlen;;
+  (* collect the pieces after the first flen ranges, in order *)
+  let rec drop w i l = match w with
+    |Empty -> l
+    |Chr _ when i > 0 -> l
+    |Chr _ -> w :: l
+    |Cat (_, w1, w2) when i >= length w1 -> drop w2 (i - length w1) l
+    |Cat (_, w1, w2) -> drop w1 i (w2 :: l) in
+  if flen >= length w then Empty else List.fold_left (fun w p -> cat w p) Empty (drop w flen []);;
 
 (* calculate the intersection of two ranges *)
 let intersect (u, v) (_u, _v) =
@@ -36,15 +68,24 @@ let intersect (u, v) (_u, _v) =
 (* select a character in the preferred range if possible *)
 let rec chr_select (u, v) l = match l with
   |(_u, _v) :: t ->
-    begin 
+    begin
       match intersect (u, v) (_u, _v) with
         |None -> chr_select (u, v) t
         |Some (__u, __v) -> __u
     end
   |[] -> u;;
 
-let select w l = List.fold_left (fun acc uv -> (chr_select uv l) :: acc) [] w;;
+let select w l =
+  let acc = ref [] in
+  iter (fun uv -> acc := (chr_select uv l) :: !acc) w;
+  List.rev !acc;;
 
-let print w = List.fold_left (fun s (u, v) -> Printf.sprintf "%s%s" (if u == v then zprint u else cls_print [(u, v)]) s) "" w;;
+let print w =
+  let buf = Buffer.create (length w) in
+  iter (fun (u, v) -> Buffer.add_string buf (if u == v then zprint u else cls_print [(u, v)])) w;
+  Buffer.contents buf;;
 
-let print_select w l = List.fold_left (fun s u -> Printf.sprintf "%s%s" s (zprint u)) "" (select w l);;
+let print_select w l =
+  let buf = Buffer.create (length w) in
+  List.iter (fun u -> Buffer.add_string buf (zprint u)) (select w l);
+  Buffer.contents buf;;
@@ -1,6 +1,6 @@
 (* © Copyright University of Birmingham, UK *)
 
-(* internal representation of a word *)
+(* internal representation of a word - a rope, append and length take constant time *)
 type t;;
 
 (* empty word - epsilon *)
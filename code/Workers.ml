@@ -0,0 +1,101 @@
+(* © Copyright University of Birmingham, UK *)
+
+type ('a, 'b) t = {
+  pid : int;
+  request : Unix.file_descr;
+  response : Unix.file_descr;
+  output : out_channel; (* over request *)
+  input : in_channel (* over response *)
+};;
+
+(* pipe ends of the parent for all the running workers, a new worker must not keep them open so that
+   each worker sees the end of its input as soon as the parent goes away *)
+let live = ref [];;
+
+let close_quietly fd = try Unix.close fd with Unix.Unix_error _ -> ();;
+
+(* file descriptors are plain integers on Unix *)
+let fd_of_int (n : int) : Unix.file_descr = Obj.magic n;;
+
+(*
+  - close everything the worker inherited (listening sockets, client connections, the event loop's fds)
+    except the standard streams and the given pipe ends
+  - the open fds are listed in /proc/self/fd, when it is missing only the other workers' pipes are known
+*)
+let close_inherited keep =
+  match Sys.readdir "/proc/self/fd" with
+    |exception Sys_error _ -> List.iter close_quietly !live
+    |fds ->
+      Array.iter (fun n -> match int_of_string_opt n with
+        |Some n when n > 2 && not (List.mem (fd_of_int n) keep) -> close_quietly (fd_of_int n)
+        |_ -> ()
+      ) fds;;
+
+(* main loop of a worker *)
+let serve f ic oc =
+  let rec loop () = match Marshal.from_channel ic with
+    |exception End_of_file -> ()
+    |x ->
+      let r = try Ok (f x) with e -> Error (Printexc.to_string e) in
+      Marshal.to_channel oc r [];
+      flush oc;
+      loop () in
+  loop ();;
+
+let spawn f =
+  let (req_r, req_w) = Unix.pipe () in
+  let (res_r, res_w) = Unix.pipe () in
+  flush_all ();
+  match Unix.fork () with
+    |0 ->
+      (* the parent's handlers (e.g. saving state on exit) must not run in the worker *)
+      Sys.set_signal Sys.sigterm Sys.Signal_default;
+      Sys.set_signal Sys.sigint Sys.Signal_default;
+      Unix.close req_w;
+      Unix.close res_r;
+      close_inherited [req_r; res_w];
+      (try serve f (Unix.in_channel_of_descr req_r) (Unix.out_channel_of_descr res_w) with _ -> ());
+      Unix._exit 0
+    |pid ->
+      Unix.close req_r;
+      Unix.close res_w;
+      Unix.set_close_on_exec req_w;
+      Unix.set_close_on_exec res_r;
+      live := req_w :: res_r :: !live;
+      {pid = pid; request = req_w; response = res_r;
+        output = Unix.out_channel_of_descr req_w; input = Unix.in_channel_of_descr res_r};;
+
+let pid w = w.pid;;
+
+let request_fd w = w.request;;
+let response_fd w = w.response;;
+
+let send w x =
+  Marshal.to_channel w.output x [];
+  flush w.output;;
+
+let receive w = (Marshal.from_channel w.input : ('b, string) result);;
+
+let call w x =
+  send w x;
+  receive w;;
+
+let stop w =
+  live := List.filter (fun fd -> fd <> w.request && fd <> w.response) !live;
+  close_quietly w.request;
+  close_quietly w.response;
+  (try Unix.kill w.pid Sys.sigkill with Unix.Unix_error _ -> ());
+  (try ignore (Unix.waitpid [] w.pid) with Unix.Unix_error _ -> ());;
+
+let cpu_count () =
+  try
+    let ic = open_in "/proc/cpuinfo" in
+    let rec count n = match input_line ic with
+      |exception End_of_file -> n
+      |l ->
+        let p = "processor" in
+        count (if String.length l >= String.length p && String.sub l 0 (String.length p) = p then n + 1 else n) in
+    let n = count 0 in
+    close_in ic;
+    max n 1
+  with Sys_error _ -> 1;;
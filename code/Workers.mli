@@ -0,0 +1,28 @@
+(* © Copyright University of Birmingham, UK *)
+
+(* a worker process applying a function to the requests it receives, requests and responses are marshalled over pipes *)
+type ('a, 'b) t;;
+
+(* fork a worker process for the specified function, the worker only keeps its own pipe ends and the standard streams *)
+val spawn : ('a -> 'b) -> ('a, 'b) t;;
+
+(* process id of the worker *)
+val pid : ('a, 'b) t -> int;;
+
+(* pipe ends of the parent: requests are written to the first one, responses are read from the second one;
+   a response is (Ok result) or (Error message) if the function raised an exception *)
+val request_fd : ('a, 'b) t -> Unix.file_descr;;
+val response_fd : ('a, 'b) t -> Unix.file_descr;;
+
+(* blocking send / receive, at most one request should be pending on a worker *)
+val send : ('a, 'b) t -> 'a -> unit;;
+val receive : ('a, 'b) t -> ('b, string) result;;
+
+(* send a request and wait for the response *)
+val call : ('a, 'b) t -> 'a -> ('b, string) result;;
+
+(* kill the worker and release its pipes *)
+val stop : ('a, 'b) t -> unit;;
+
+(* number of processors listed in /proc/cpuinfo, 1 if unknown *)
+val cpu_count : unit -> int;;
@@ -1,8 +1,6 @@
 (* © Copyright University of Birmingham, UK *)
 
 open Common
-open Beta
-open Phi
 
 type t = {
   (* NFA being analysed *)
@@ -11,41 +9,43 @@ type t = {
   kset : IntSet.t;
   (* current prefix word *)
   mutable w : Word.t;
-  (* set of betas seen so far *)
-  mutable bcache : BetaSet.t;
-  (* set of phis seen so far *)
-  mutable pcache : PhiSet.t;
+  (* betas / phis seen so far, keyed on their ids (holding on to them keeps the ids stable) *)
+  bcache : (int, Beta.t) Hashtbl.t;
+  pcache : (int, Phi.t) Hashtbl.t;
   (* machine component - current kleene hits *)
   mutable hits : (int * Beta.t) list;
   (* machine component - betas to be evolved *)
   mutable evolve : (Word.t * Beta.t) list;
   (* machine component - betas to be advanced *)
   mutable advance : (Word.t * Beta.t) list;
+  (* analysis budget, shared with the other analysers *)
+  budget : Budget.t;
   (* processing flags *)
   mutable flgs : Flags.t;
 };;
 
-let init nfa kset = {
+let init nfa kset budget = {
   nfa = nfa;
   kset = kset;
   w = Word.empty;
-  bcache = BetaSet.empty;
-  pcache = PhiSet.empty;
+  bcache = Hashtbl.create 64;
+  pcache = Hashtbl.create 64;
   (* start evolving the root state *)
   hits = []; evolve = [(Word.empty, Beta.make (Nfa.root nfa))];
   advance = [];
+  budget = budget;
   flgs = Flags.empty
 };;
 
 let next m =
-  let rec explore () = match (m.hits, m.evolve, m.advance) with
+  let rec explore () = if Budget.tick m.budget then None else match (m.hits, m.evolve, m.advance) with
     (* process hits *)
     |((ik, b) :: t, _, _) ->
       m.hits <- t;
       let (_, ep) = Phi.evolve (m.nfa, m.w, Phi.make (Beta.elems b)) None in
-      if not (PhiSet.mem ep m.pcache) then (
+      if not (Hashtbl.mem m.pcache (Phi.id ep)) then (
         (* never seen before phi, return *)
-        m.pcache <- PhiSet.add ep m.pcache;
+        Hashtbl.replace m.pcache (Phi.id ep) ep;
         Some (ik, m.w, ep)
       ) else explore ()
     |([], (w, b) :: t, _) ->
@@ -60,9 +60,9 @@ let next m =
       explore ()
     |([], [], (w, b) :: t) ->
       m.advance <- t;
-      if not (BetaSet.mem b m.bcache) then (
+      if not (Hashtbl.mem m.bcache (Beta.id b)) then (
         (* never seen before beta, advance *)
-        m.bcache <- BetaSet.add b m.bcache;
+        Hashtbl.replace m.bcache (Beta.id b) b;
         m.evolve <- Beta.advance (m.nfa, w, b);
       ); explore ()
     |([], [], []) ->
@@ -5,10 +5,10 @@ open Common
 (* internal representation of the analyser *)
 type t;;
 
-(* initialize analyser instance with the given NFA and the pumpable kleene set *)
-val init : Nfa.t -> IntSet.t -> t;;
+(* initialize analyser instance with the given NFA, the pumpable kleene set and the analysis budget *)
+val init : Nfa.t -> IntSet.t -> Budget.t -> t;;
 
-(* calculate the next (x, phi) corresponding to some pumpable kleene *)
+(* calculate the next (x, phi) corresponding to some pumpable kleene, None once exhausted or out of budget *)
 val next : t -> (int * Word.t * Phi.t) option;;
 
 (* read current analyser flags *)
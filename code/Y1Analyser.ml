@@ -1,8 +1,6 @@
 (* © Copyright University of Birmingham, UK *)
 
 open Common
-open Product
-open Triple
 
 type t = {
   (* NFA being analysed *)
@@ -13,41 +11,43 @@ type t = {
   brset : IntSet.t;
   (* current prefix *)
   w : Word.t;
-  (* set of products seen so far *)
-  mutable pcache : ProductSet.t;
-  (* set of triples seen so far *)
-  mutable tcache : TripleSet.t;
+  (* products / triples seen so far, keyed on their ids (holding on to them keeps the ids stable) *)
+  pcache : (int, Product.t) Hashtbl.t;
+  tcache : (int, Triple.t) Hashtbl.t;
   (* machine component - triples reached *)
   mutable tpls : (Word.t * Triple.t) list;
   (* machine component - products to be evolved *)
   mutable evolve : (Word.t * Product.t) list;
   (* machine component - products to be advanced *)
   mutable advance : (Word.t * Product.t) list;
+  (* analysis budget, shared with the other analysers *)
+  budget : Budget.t;
   (* processing flags *)
   mutable flgs : Flags.t;
 };;
 
-let init (nfa, w, p) (ik, brset) = {
+let init (nfa, w, p) (ik, brset) budget = {
   nfa = nfa;
   ik = ik;
   brset = brset;
   w = w;
-  pcache = ProductSet.empty;
-  tcache = TripleSet.empty;
+  pcache = Hashtbl.create 64;
+  tcache = Hashtbl.create 64;
   tpls = [];
   (* start with evolving the kleene state and the corresponding phi *)
   evolve = [(w, Product.make ik p)];
   advance = [];
+  budget = budget;
   flgs = Flags.empty
 };;
 
 let next m =
-  let rec explore () = match (m.tpls, m.evolve, m.advance) with
+  let rec explore () = if Budget.tick m.budget then None else match (m.tpls, m.evolve, m.advance) with
     |((w, tpl) :: t, _, _) ->
       m.tpls <- t;
-      if not (TripleSet.mem tpl m.tcache) then (
+      if not (Hashtbl.mem m.tcache (Triple.id tpl)) then (
         (* never seen before triple, return *)
-        m.tcache <- TripleSet.add tpl m.tcache;
+        Hashtbl.replace m.tcache (Triple.id tpl) tpl;
         Some (Word.suffix w (Word.length m.w), tpl)
       ) else explore ()
     |([], (w, p) :: t, _) ->
@@ -64,9 +64,9 @@ let next m =
       ) else explore ()
     |([], [], (w, p) :: t) ->
       m.advance <- t;
-      if not (ProductSet.mem p m.pcache) then (
+      if not (Hashtbl.mem m.pcache (Product.id p)) then (
         (* never seen before product, advance *)
-        m.pcache <- ProductSet.add p m.pcache;
+        Hashtbl.replace m.pcache (Product.id p) p;
         m.evolve <- Product.advance (m.nfa, w, p);
         explore ()
       ) else explore ()
@@ -5,10 +5,10 @@ open Common
 (* internal representation of the analyser *)
 type t;;
 
-(* initialize analyser instance for the given (x, phi) and the pumpable kleene *)
-val init : (Nfa.t * Word.t * Phi.t) -> (int * IntSet.t) -> t;;
+(* initialize analyser instance for the given (x, phi), the pumpable kleene and the analysis budget *)
+val init : (Nfa.t * Word.t * Phi.t) -> (int * IntSet.t) -> Budget.t -> t;;
 
-(* calculate the next (y1, triple) *)
+(* calculate the next (y1, triple), None once exhausted or out of budget *)
 val next : t -> (Word.t * Triple.t) option;;
 
 (* read current analyser flags *)
@@ -9,32 +9,35 @@ type t = {
   ik : int;
   (* current prefix *)
   w : Word.t;
-  (* set of triples seen so far *)
-  mutable cache : TripleSet.t;
+  (* triples seen so far, keyed on their ids (holding on to them keeps the ids stable) *)
+  cache : (int, Triple.t) Hashtbl.t;
   (* machine component - triples to be checked for convergence *)
   mutable evolve : (Word.t * Triple.t) list;
   (* machine component - triples to be advanced *)
   mutable advance : (Word.t * Triple.t) list;
+  (* analysis budget, shared with the other analysers *)
+  budget : Budget.t;
   (* processing flags *)
   mutable flgs : Flags.t;
 };;
 
-let init (nfa, w, tpl) ik = {
+let init (nfa, w, tpl) ik budget = {
   nfa = nfa;
   ik = ik;
   w = w;
-  cache = TripleSet.empty;
+  cache = Hashtbl.create 64;
   evolve = [];
   (*
     - start with advancing the given triple
     - y2 can't be empty since it also includes the first branching character ('a' in y1ay2)
   *)
   advance = [(w, tpl)]; 
+  budget = budget;
   flgs = Flags.empty;
 };;
 
 let next m =
-  let rec explore () = match (m.evolve, m.advance) with
+  let rec explore () = if Budget.tick m.budget then None else match (m.evolve, m.advance) with
     |((w, tpl) :: t, _) ->
       m.evolve <- t;
       let (i, j, p) = elems tpl in
@@ -43,9 +46,9 @@ let next m =
       let etpl = Triple.make i j ep in
       m.flgs <- Flags.union flgs m.flgs;
       (* ignore any paths that also lead to acceptance *)
-      if not (Flags.is_accepting flgs || TripleSet.mem etpl m.cache) then (
+      if not (Flags.is_accepting flgs || Hashtbl.mem m.cache (Triple.id etpl)) then (
         (* never seen before triple, check for convergence *)
-        m.cache <- TripleSet.add etpl m.cache;
+        Hashtbl.replace m.cache (Triple.id etpl) etpl;
         if (Util.is_epsilon_reachable m.nfa w i m.ik) && (Util.is_epsilon_reachable m.nfa w j m.ik) then
           (* converges, return *)
           Some (Word.suffix w (Word.length m.w), ep)
@@ -3,10 +3,10 @@
 (* internal representation of the analyser *)
 type t;;
 
-(* initialize analyser instance for the specified triple and the kleene state *)
-val init : (Nfa.t * Word.t * Triple.t) -> int -> t;;
+(* initialize analyser instance for the specified triple, the kleene state and the analysis budget *)
+val init : (Nfa.t * Word.t * Triple.t) -> int -> Budget.t -> t;;
 
-(* calculate the next (y2, phi) *)
+(* calculate the next (y2, phi), None once exhausted or out of budget *)
 val next : t -> (Word.t * Phi.t) option;;
 
 (* read analyser flags *)
@@ -1,35 +1,37 @@
 (* © Copyright University of Birmingham, UK *)
 
 open Common
-open Phi
 
 type t = {
   (* NFA being analysed *)
   nfa : Nfa.t;
   (* current prefix *)
   w : Word.t;
-  (* set of phis seen so far *)
-  mutable cache : PhiSet.t;
+  (* phis seen so far, keyed on their ids (holding on to them keeps the ids stable) *)
+  cache : (int, Phi.t) Hashtbl.t;
   (* machine component - phis to be checked for non-acceptance *)
   mutable evolve : (Word.t * Phi.t) list;
   (* machine component - phis to be advanced *)
   mutable advance : (Word.t * Phi.t) list;
+  (* analysis budget, shared with the other analysers *)
+  budget : Budget.t;
   (* processing flags *)
   mutable flgs : Flags.t;
 };;
 
-let init (nfa, w, p) = {
+let init (nfa, w, p) budget = {
   nfa = nfa;
   w = w;
-  cache = PhiSet.empty;
+  cache = Hashtbl.create 64;
   (* start with evolving the given phi *)
   evolve = [(w, p)];
   advance = [];
+  budget = budget;
   flgs = Flags.empty
 };;
 
 let next m =
-  let rec explore () = match (m.evolve, m.advance) with
+  let rec explore () = if Budget.tick m.budget then None else match (m.evolve, m.advance) with
     |((w, p) :: t, _) ->
       m.evolve <- t;
       begin
@@ -49,9 +51,9 @@ let next m =
       end
     |([], (w, ep) :: t) ->
       m.advance <- t;
-      if not (PhiSet.mem ep m.cache) then (
+      if not (Hashtbl.mem m.cache (Phi.id ep)) then (
         (* never seen before phi, need to be explored *)
-        m.cache <- PhiSet.add ep m.cache;
+        Hashtbl.replace m.cache (Phi.id ep) ep;
         let (advanced, nomatch) = Phi.explore (m.nfa, w, ep) in
         (* schedule the resulting phis to be checked for non-acceptance *)
         m.evolve <- advanced;
@@ -3,10 +3,10 @@
 (* internal representation of the analyser *)
 type t;;
 
-(* initialize analyser instance for the specified (xy, phi) *)
-val init : (Nfa.t * Word.t * Phi.t) -> t;;
+(* initialize analyser instance for the specified (xy, phi) and the analysis budget *)
+val init : (Nfa.t * Word.t * Phi.t) -> Budget.t -> t;;
 
-(* calculate the next (z, phi) *)
+(* calculate the next (z, phi), None once exhausted or out of budget *)
 val next : t -> (Word.t * Phi.t) option;;
 
 (* read analyser flags *)
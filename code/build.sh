@@ -16,6 +16,9 @@ ocamlc -c Common.mli Common.ml
 ocamlc -c Nfa.mli Nfa.ml
 ocamlc -c RegexScanner.mli RegexScanner.ml
 ocamlc -c Flags.mli Flags.ml
+ocamlc -c Budget.mli Budget.ml
+ocamlc -c Phases.mli Phases.ml
+ocamlc -c Lru.mli Lru.ml
 ocamlc -c Word.mli Word.ml
 ocamlc -c Util.mli Util.ml
 ocamlc -c Beta.mli Beta.ml
@@ -28,6 +31,7 @@ ocamlc -c Y2Analyser.mli Y2Analyser.ml
 ocamlc -c ZAnalyser.mli ZAnalyser.ml
 ocamlc -c AnalyserMain.mli AnalyserMain.ml
 ocamlc -c RuleScanner.mli RuleScanner.ml
+ocamlc -c Workers.mli Workers.ml
 ocamlc -c Run.ml
-ocamlc str.cma ParsingData.cmo RegexParser.cmo RegexLexer.cmo PatternParser.cmo PatternLexer.cmo ParsingMain.cmo Common.cmo Nfa.cmo RegexScanner.cmo Flags.cmo Word.cmo Util.cmo Beta.cmo Phi.cmo Triple.cmo Product.cmo XAnalyser.cmo Y1Analyser.cmo Y2Analyser.cmo ZAnalyser.cmo unix.cma AnalyserMain.cmo RuleScanner.cmo Run.cmo -o scan.bin
+ocamlc str.cma unix.cma ParsingData.cmo RegexParser.cmo RegexLexer.cmo PatternParser.cmo PatternLexer.cmo ParsingMain.cmo Common.cmo Nfa.cmo RegexScanner.cmo Flags.cmo Budget.cmo Phases.cmo Lru.cmo Word.cmo Util.cmo Beta.cmo Phi.cmo Triple.cmo Product.cmo XAnalyser.cmo Y1Analyser.cmo Y2Analyser.cmo ZAnalyser.cmo AnalyserMain.cmo RuleScanner.cmo Workers.cmo Run.cmo -o scan.bin
 rm *.cmi *.cmo RegexParser.mli RegexParser.ml RegexLexer.ml PatternParser.mli PatternParser.ml PatternLexer.ml
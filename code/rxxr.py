@@ -0,0 +1,91 @@
+#!/bin/python
+
+# In-process python binding to the analyser (ParsingMain.parse_pattern + Nfa.make +
+# AnalyserMain.search_optimized) through the binding.so shared object built by dune:
+#
+#   dune build binding.so
+#
+#   import rxxr
+#   r = rxxr.analyse("/(a|a)*b/")
+#   if r.status == rxxr.VULNERABLE: ...
+
+import os
+import ctypes
+import threading
+import collections
+
+
+# analysis status codes (see Binding.ml)
+SAFE = 0
+PUMPABLE = 1
+VULNERABLE = 2
+ERROR = 3
+
+# analyser flags (see Flags.ml)
+INTERRUPTED = 1
+ACCEPTING = 2
+KLNHIT = 4
+EOIHIT = 8
+PRUNED = 16
+TIMEOUT = 32
+
+# default location of the shared object, override with RXXR_LIB
+default_lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_build", "default", "binding.so")
+
+# kleene is the (start, end) location of the vulnerable kleene in the pattern, None if there is
+# none; prefix, pumpable and suffix are the bytes of the attack string
+Result = collections.namedtuple("Result", ["status", "flags", "kleene", "prefix", "pumpable", "suffix", "error"])
+
+class rxxr_result(ctypes.Structure):
+  _fields_ = [
+    ("status", ctypes.c_int),
+    ("flags", ctypes.c_int),
+    ("kleene_start", ctypes.c_int),
+    ("kleene_end", ctypes.c_int),
+    ("prefix", ctypes.POINTER(ctypes.c_char)),
+    ("prefix_len", ctypes.c_size_t),
+    ("pumpable", ctypes.POINTER(ctypes.c_char)),
+    ("pumpable_len", ctypes.c_size_t),
+    ("suffix", ctypes.POINTER(ctypes.c_char)),
+    ("suffix_len", ctypes.c_size_t),
+    ("error", ctypes.c_char_p)
+  ]
+
+# the ocaml runtime is single threaded
+lock = threading.Lock()
+lib = None
+
+def load(fname = None):
+  global lib
+  with lock:
+    if lib is None:
+      lib = ctypes.CDLL(fname or os.environ.get("RXXR_LIB", default_lib))
+      lib.rxxr_init.argtypes = []
+      lib.rxxr_init.restype = None
+      lib.rxxr_analyse.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_double, ctypes.POINTER(rxxr_result)]
+      lib.rxxr_analyse.restype = ctypes.c_int
+      lib.rxxr_free.argtypes = [ctypes.POINTER(rxxr_result)]
+      lib.rxxr_free.restype = None
+      lib.rxxr_init()
+  return lib
+
+# analyse a pattern of the form [/]REGEX[/MODS] (str or bytes, str is utf-8 encoded), slim is the
+# pruning limit of search_optimized (same as scan.bin -slim), timeout is the analysis budget in seconds
+# (TIMEOUT is set in flags if it runs out, 0 means no limit)
+def analyse(pattern, slim = 100, timeout = 0):
+  if isinstance(pattern, str):
+    pattern = pattern.encode("utf-8")
+  load()
+  res = rxxr_result()
+  with lock:
+    if lib.rxxr_analyse(pattern, len(pattern), slim, timeout, ctypes.byref(res)) != 0:
+      raise RuntimeError("rxxr_analyse failed")
+    try:
+      kleene = (res.kleene_start, res.kleene_end) if res.kleene_start >= 0 else None
+      return Result(res.status, res.flags, kleene,
+        ctypes.string_at(res.prefix, res.prefix_len),
+        ctypes.string_at(res.pumpable, res.pumpable_len),
+        ctypes.string_at(res.suffix, res.suffix_len),
+        res.error.decode("utf-8", "replace") if res.error else None)
+    finally:
+      lib.rxxr_free(ctypes.byref(res))
@@ -0,0 +1,91 @@
+/* © Copyright University of Birmingham, UK */
+
+/* C interface of the shared object (binding.so) used by the python binding (rxxr.py) */
+
+#include <stdlib.h>
+#include <string.h>
+#include <caml/mlvalues.h>
+#include <caml/memory.h>
+#include <caml/alloc.h>
+#include <caml/callback.h>
+
+/* result of an analysis, the strings are owned by the caller and released with rxxr_free */
+typedef struct {
+  int status;       /* 0: safe, 1: pumpable, 2: vulnerable, 3: error (see Binding.ml) */
+  int flags;        /* Flags.t bit-mask */
+  int kleene_start; /* location of the vulnerable kleene in the input, -1 if none */
+  int kleene_end;
+  char *prefix;
+  size_t prefix_len;
+  char *pumpable;
+  size_t pumpable_len;
+  char *suffix;
+  size_t suffix_len;
+  char *error;
+} rxxr_result;
+
+static int initialised = 0;
+
+/* start the ocaml runtime (runs the initialisation of Binding.ml), must be called before rxxr_analyse */
+void rxxr_init(void)
+{
+  static char *argv[] = { "rxxr", NULL };
+  if (!initialised) {
+    caml_startup(argv);
+    initialised = 1;
+  }
+}
+
+/* malloc-ed copy of an ocaml string, which may contain NUL characters */
+static char *copy_string(value s, size_t *len)
+{
+  size_t n = caml_string_length(s);
+  char *c = malloc(n + 1);
+  if (c != NULL) {
+    memcpy(c, String_val(s), n);
+    c[n] = '\0';
+  }
+  if (len != NULL)
+    *len = n;
+  return c;
+}
+
+/* analyse the pattern [/]REGEX[/MODS] of the given length within timeout seconds (no limit if not positive),
+   returns 0 on success; not thread-safe */
+int rxxr_analyse(const char *regex, size_t len, int slim, double timeout, rxxr_result *res)
+{
+  CAMLparam0();
+  CAMLlocal3(r, t, v);
+  const value *analyse;
+
+  memset(res, 0, sizeof(rxxr_result));
+  analyse = initialised ? caml_named_value("rxxr_analyse") : NULL;
+  if (analyse == NULL)
+    CAMLreturnT(int, -1);
+
+  r = caml_alloc_string(len);
+  memcpy((char *) Bytes_val(r), regex, len);
+  t = caml_copy_double(timeout);
+  v = caml_callback3_exn(*analyse, r, Val_int(slim), t);
+  if (Is_exception_result(v))
+    CAMLreturnT(int, -1);
+
+  res->status = Int_val(Field(v, 0));
+  res->flags = Int_val(Field(v, 1));
+  res->kleene_start = Int_val(Field(v, 2));
+  res->kleene_end = Int_val(Field(v, 3));
+  res->prefix = copy_string(Field(v, 4), &res->prefix_len);
+  res->pumpable = copy_string(Field(v, 5), &res->pumpable_len);
+  res->suffix = copy_string(Field(v, 6), &res->suffix_len);
+  res->error = copy_string(Field(v, 7), NULL);
+  CAMLreturnT(int, 0);
+}
+
+void rxxr_free(rxxr_result *res)
+{
+  free(res->prefix);
+  free(res->pumpable);
+  free(res->suffix);
+  free(res->error);
+  memset(res, 0, sizeof(rxxr_result));
+}
@@ -0,0 +1,32 @@
+(* © Copyright University of Birmingham, UK *)
+
+open Common
+
+let compile r = Nfa.make (ParsingMain.parse_pattern (Lexing.from_string (r ^ "\n")));;
+
+let print_ranges l = String.concat "," (List.map (fun (u, v) -> cls_print [(u, v)]) l);;
+
+(*
+  - pins the order and granularity of Phi.explore from the root of a pattern: one entry per run of adjacent
+    characters leading to the same states, in ascending order, followed by the failing ranges
+  - these ranges end up in the reported attack words
+*)
+let check r expected expected_nomatch =
+  let nfa = compile r in
+  let (_, p) = Phi.evolve (nfa, Word.empty, Phi.make (IntSet.singleton (Nfa.root nfa))) None in
+  let (phis, nomatch) = Phi.explore (nfa, Word.empty, p) in
+  let ranges = List.map (fun (w, _) -> match Word.tail w with
+    |Some (uv, _) -> uv
+    |None -> failwith (r ^ ": empty word")) phis in
+  if ranges <> expected then
+    failwith (Printf.sprintf "%s: advanced over [%s] expected [%s]" r (print_ranges ranges) (print_ranges expected));
+  if nomatch <> expected_nomatch then
+    failwith (Printf.sprintf "%s: failing [%s] expected [%s]" r (print_ranges nomatch) (print_ranges expected_nomatch));
+  Printf.printf "%s: ok\n" r;;
+
+let () =
+  (* adjacent classes leading to the same state are merged *)
+  check "/([a-c]|[d-f])x/" [('a', 'f')] [(zmin, '`'); ('g', zmax)];
+  (* overlapping classes are split where the targets change *)
+  check "/[a-c]x|[b-d]y/" [('a', 'a'); ('b', 'c'); ('d', 'd')] [(zmin, '`'); ('e', zmax)];
+  check "/x|a|m/" [('a', 'a'); ('m', 'm'); ('x', 'x')] [(zmin, '`'); ('b', 'l'); ('n', 'w'); ('y', zmax)];;
@@ -0,0 +1,535 @@
+#!/bin/python
+
+# Shared driver for the *-vulns-validate.py scripts. Each script only carries
+# its own suite of vulnerabilities and calls validate() with it.
+
+import re
+import os
+import time
+import csv
+import sys
+import json
+import argparse
+import platform
+import functools
+import importlib
+import statistics
+import collections
+import multiprocessing
+import concurrent.futures
+
+import store
+import scanlog
+
+# numpy is only needed for --sweep
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# format strings (for the table)
+output_format = "{0:>5}|{1:>10}|{2:>23}|{3:>23}|{4:>23}|{5:>10}|{6:^7}|{7:<30}|"
+header_format = "{0:^5}|{1:^10}|{2:^23}|{3:^23}|{4:^23}|{5:^10}|{6:^7}|{7:^30}|"
+hline = "-".rjust(140, "-")
+
+# format strings (for the sweep table)
+sweep_format = "{0:>5}|{1:>12}|{2:>6}|{3:>6}|{4:>10}|{5:>10}|{6:>10}|{7:<30}|"
+sweep_header_format = "{0:^5}|{1:^12}|{2:^6}|{3:^6}|{4:^10}|{5:^10}|{6:^10}|{7:^30}|"
+sweep_hline = "-".rjust(98, "-")
+
+# columns of the csv output (shared by all modes), list values are joined with ";"
+csv_fields = ["index", "engine", "status", "pumps", "median", "min", "iqr", "growth", "verdict",
+  "timeout_at", "growth_class", "growth_param", "notes"]
+
+# timing engine parameters: each sample loops the match until it runs for at least this long
+min_sample_ns = 10 * 1000 * 1000
+# upper bound on the number of matches per sample
+max_sample_loops = 100000
+# minimum growth (percent) for a verdict of YES
+min_growth = 10.0
+# fits that predict less than this much slow-down over the swept range are reported as FLAT
+min_fold = 2.0
+
+# regex engines that can be timed: name -> module offering an re-compatible compile() / match(),
+# the ones that are not installed locally are left out
+engines = collections.OrderedDict([
+  ("re", "re"),
+  ("regex", "regex"),
+  ("pcre", "pcre"),
+  ("re2", "re2")
+])
+
+# python flags handed to the engines as an inline (?imsx) group, which all of them understand
+inline_flags = [(re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x")]
+
+# number of compiled patterns kept per process
+pattern_cache_size = 1024
+
+# robust statistics over the per-match times (nanoseconds) of a measurement
+Timing = collections.namedtuple("Timing", ["median", "min", "iqr"])
+
+# parse command-line arguments
+def parse_args():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--base", help="base pump-count to use (default is 0)", type = int, default = 0)
+  parser.add_argument("--stress", help="stress-test the specified vulnerability", default = "")
+  parser.add_argument("--jobs", help="number of worker processes (default is 1, 0 means one per core)", type = int, default = 1)
+  parser.add_argument("--timeout", help="wall-clock limit (seconds) for a single match, also runs skipped entries", type = float, default = None)
+  parser.add_argument("--repeat", help="number of timing samples per measurement (default is 5)", type = int, default = 5)
+  parser.add_argument("--engine", help="time this engine, may be repeated (default is every installed one of: {0:s})".format(", ".join(engines)),
+    action = "append", choices = list(engines), default = None)
+  parser.add_argument("--log", help="validate the vulnerabilities reported in this RXXR result log instead of the built-in suite", default = None)
+  parser.add_argument("--pumps", help="pump-count for the entries read with --log (default is 8)", type = int, default = 8)
+  parser.add_argument("--format", help="output format (default is table), json / csv / ndjson print one record per measurement",
+    choices = ["table", "json", "csv", "ndjson"], default = "table")
+  parser.add_argument("--store", help="keep results in this SQLite file and only re-measure new, changed or expired entries", default = None)
+  parser.add_argument("--ttl", help="age (days) after which a stored result is re-measured (default is 7)", type = float, default = 7.0)
+  parser.add_argument("--sweep", help="sweep pump-counts geometrically and fit the growth class (needs numpy)", action = "store_true")
+  parser.add_argument("--sweep-ratio", help="ratio between consecutive pump-counts of a sweep (default is 1.5)", type = float, default = 1.5)
+  parser.add_argument("--sweep-max", help="largest pump-count of a sweep (default is 256)", type = int, default = 256)
+  parser.add_argument("--sweep-limit", help="stop a sweep once a match takes this long, in seconds (default is 1)", type = float, default = 1.0)
+  args = parser.parse_args()
+  if args.sweep and numpy is None:
+    parser.error("--sweep requires numpy")
+  if args.sweep_ratio <= 1.0:
+    parser.error("--sweep-ratio must be > 1")
+  if args.sweep_max < 1:
+    parser.error("--sweep-max must be >= 1")
+  if args.timeout is not None and args.timeout <= 0:
+    parser.error("--timeout must be > 0")
+  if args.ttl < 0:
+    parser.error("--ttl must be >= 0")
+  if args.repeat < 3:
+    parser.error("--repeat must be >= 3")
+  if args.engine is None:
+    args.engine = installed_engines()
+  for name in args.engine:
+    if load_engine(name) is None:
+      parser.error("engine {0:s} is not installed".format(name))
+  if args.jobs < 0:
+    parser.error("--jobs must be >= 0")
+  if args.jobs == 0:
+    args.jobs = os.cpu_count() or 1
+  return args
+
+# time `loops` consecutive matches, in nanoseconds
+def sample(p, atk, loops):
+  match = p.match
+  ts = time.perf_counter_ns()
+  for i in range(loops):
+    match(atk)
+  te = time.perf_counter_ns()
+  return te - ts
+
+# calibrate the loop count the same way timeit.autorange does (1, 2, 5, 10, 20, 50, ...) and
+# then collect `repeat` samples, slow matches simply end up with a loop count of 1; `starting` (if
+# given) is told the loop count before each sample
+def measure(p, atk, repeat, starting = None):
+  def timed(loops):
+    if starting is not None:
+      starting(loops)
+    return sample(p, atk, loops)
+
+  loops = 1
+  while loops < max_sample_loops:
+    if timed(loops) >= min_sample_ns:
+      break
+    loops = loops * 5 // 2 if str(loops)[0] == "2" else loops * 2
+  times = [timed(loops) / loops for i in range(repeat)]
+  q1, q2, q3 = statistics.quantiles(times, n = 4)
+  return Timing(statistics.median(times), min(times), q3 - q1)
+
+# runs in a child process, announces each sample ("sample", loops) and reports the timing ("done", timing)
+# back to the parent
+def measure_worker(p, atk, repeat, conn):
+  t = measure(p, atk, repeat, lambda loops: conn.send(("sample", loops)))
+  conn.send(("done", t))
+  conn.close()
+
+# measure p against atk; with a timeout the measurement runs in a child process which gets killed
+# as soon as a single match takes longer than that (a sample of n matches gets n times the timeout),
+# in which case None is returned
+def timed_measure(p, atk, repeat, timeout):
+  if timeout is None:
+    return measure(p, atk, repeat)
+
+  rconn, wconn = multiprocessing.Pipe(duplex = False)
+  proc = multiprocessing.Process(target = measure_worker, args = (p, atk, repeat, wconn))
+  proc.start()
+  wconn.close()
+  try:
+    # the first budget also covers the child's start up
+    budget = timeout
+    while rconn.poll(budget):
+      kind, value = rconn.recv()
+      if kind == "done":
+        return value
+      budget = timeout * value
+    return None
+  except EOFError:
+    # child died without reporting (e.g. recursion limit / out of memory)
+    return None
+  finally:
+    if proc.is_alive():
+      proc.kill()
+    proc.join()
+    rconn.close()
+
+# growth (percent) between two measurements, taken over the fastest samples since the minimum is
+# the statistic least disturbed by other load on the box
+def growth(t1, t2):
+  return ((t2.min - t1.min) / t1.min) * 100 if t1.min > 0 else float("inf")
+
+# the run-time grew if the fastest second sample is clearly slower than the fastest first one
+def verdict(t1, t2):
+  return "YES" if growth(t1, t2) >= min_growth else "NO"
+
+# entries marked "skip" are only attempted when there is a timeout to guard them
+def skipped(tpl, timeout):
+  return "skip" in tpl and timeout is None
+
+# engine module, None if it is not installed
+@functools.lru_cache(maxsize = None)
+def load_engine(name):
+  try:
+    return importlib.import_module(engines[name])
+  except ImportError:
+    return None
+
+def installed_engines():
+  return [name for name in engines if load_engine(name) is not None]
+
+def engine_version(name):
+  if name == "re":
+    return platform.python_version()
+  return str(getattr(load_engine(name), "__version__", "unknown"))
+
+# compiled patterns are memoized per (engine, exp, flags) so that stress / sweep runs and repeated
+# entries (the suites list some expressions more than once) compile just once per process
+@functools.lru_cache(maxsize = pattern_cache_size)
+def compile_pattern(engine, exp, flags):
+  mods = "".join(c for (f, c) in inline_flags if flags & f)
+  return load_engine(engine).compile("(?{0:s}){1:s}".format(mods, exp) if mods else exp)
+
+def compile_tpl(tpl, engine):
+  return compile_pattern(engine, tpl["exp"], tpl["flags"] if "flags" in tpl else 0)
+
+# each engine raises its own exception type for patterns it cannot compile
+def compile_error(e):
+  return "{0:s}: {1}".format(type(e).__name__, e)
+
+# attack strings for an increasing sequence of pump-counts, built in O(n) rather than by repeated
+# concatenation: the prefix and the pumps are laid out once for the largest count and every attack
+# is cut from that single buffer
+def attacks(tpl, counts):
+  head = "".join((tpl["prefix"], tpl["pumpable"] * counts[-1]))
+  plen = len(tpl["prefix"])
+  step = len(tpl["pumpable"])
+  for n in counts:
+    body = head if n == counts[-1] else head[:plen + step * n]
+    yield (n, body + tpl["suffix"] if tpl["suffix"] else body)
+
+# result record of one measurement (or one entry), times are in seconds
+def make_record(tpl, engine, status, **fields):
+  rec = collections.OrderedDict([("index", tpl["index"]), ("engine", engine), ("status", status)])
+  rec.update(fields)
+  rec["notes"] = tpl["notes"] if "notes" in tpl else ""
+  return rec
+
+def error_record(tpl, engine, e):
+  rec = make_record(tpl, engine, "error")
+  rec["notes"] = compile_error(e)
+  return rec
+
+# profiling function - returns the result record of the entry
+def profile(tpl, args, engine):
+  if skipped(tpl, args.timeout):
+    return make_record(tpl, engine, "skipped")
+
+  n = args.base + tpl["n"]
+  (n1, atk1), (n2, atk2) = attacks(tpl, [n, n + 1])
+
+  try:
+    p = compile_tpl(tpl, engine)
+  except Exception as e:
+    return error_record(tpl, engine, e)
+
+  t1 = timed_measure(p, atk1, args.repeat, args.timeout)
+  if t1 is None:
+    return make_record(tpl, engine, "timeout", pumps = [n1, n2], timeout_at = n1, verdict = "YES")
+
+  t2 = timed_measure(p, atk2, args.repeat, args.timeout)
+  if t2 is None:
+    return make_record(tpl, engine, "timeout", pumps = [n1, n2], timeout_at = n2, verdict = "YES")
+
+  return make_record(tpl, engine, "ok", pumps = [n1, n2],
+    median = [t1.median / 1e9, t2.median / 1e9], min = [t1.min / 1e9, t2.min / 1e9], iqr = [t1.iqr / 1e9, t2.iqr / 1e9],
+    growth = growth(t1, t2), verdict = verdict(t1, t2))
+
+# stress testing function - yields a result record per pump-count
+def stress(tpl, args, engine):
+  if skipped(tpl, args.timeout):
+    return
+
+  try:
+    p = compile_tpl(tpl, engine)
+  except Exception as e:
+    yield error_record(tpl, engine, e)
+    return
+
+  tprev = None
+
+  # 20 iterations should be enough
+  for i, atk in attacks(tpl, list(range(1, 21))):
+    t = timed_measure(p, atk, args.repeat, args.timeout)
+    if t is None:
+      # no point in pumping any further
+      yield make_record(tpl, engine, "timeout", pumps = i, timeout_at = i, verdict = "YES")
+      return
+    yield make_record(tpl, engine, "ok", pumps = i, median = t.median / 1e9, min = t.min / 1e9, iqr = t.iqr / 1e9,
+      growth = growth(tprev, t) if tprev is not None else None, verdict = verdict(tprev, t) if tprev is not None else None)
+    tprev = t
+
+# pump-counts base + 1, base + r, base + r^2, ... up to base + max (rounded, without duplicates)
+def sweep_counts(base, ratio, nmax):
+  counts = []
+  x = 1.0
+  while round(x) <= nmax:
+    if not counts or base + round(x) != counts[-1]:
+      counts.append(base + round(x))
+    x = x * ratio
+  return counts
+
+# fit log(t) against log(n) (t = a * n^d) and against n (t = a * b^n) with least squares and pick
+# the model with the smaller residual, returns (class, parameter) where the parameter is the degree
+# for POLY / FLAT and the base for EXP
+def fit_growth(counts, times):
+  n = numpy.array(counts, dtype = float)
+  logt = numpy.log(numpy.array(times, dtype = float))
+  fits = []
+  for x in (numpy.log(n), n):
+    a = numpy.vstack([x, numpy.ones(len(x))]).T
+    coef, res, rank, sv = numpy.linalg.lstsq(a, logt, rcond = None)
+    rss = res[0] if len(res) > 0 else float(numpy.sum((a.dot(coef) - logt) ** 2))
+    fits.append((rss, coef[0]))
+  (prss, degree), (erss, slope) = fits
+  if prss <= erss:
+    fold = numpy.exp(degree * (numpy.log(n[-1]) - numpy.log(n[0])))
+  else:
+    fold = numpy.exp(slope * (n[-1] - n[0]))
+  if fold < min_fold:
+    return ("FLAT", degree)
+  return ("POLY", degree) if prss <= erss else ("EXP", numpy.exp(slope))
+
+# sweep function - measures a geometric range of pump-counts and returns the result record
+def sweep(tpl, args, engine):
+  if skipped(tpl, args.timeout):
+    return make_record(tpl, engine, "skipped")
+
+  try:
+    p = compile_tpl(tpl, engine)
+  except Exception as e:
+    return error_record(tpl, engine, e)
+
+  counts = []
+  times = []
+  cutoff = None
+  for n, atk in attacks(tpl, sweep_counts(args.base, args.sweep_ratio, args.sweep_max)):
+    t = timed_measure(p, atk, args.repeat, args.timeout)
+    if t is None:
+      cutoff = n
+      break
+    counts.append(n)
+    times.append(max(t.min, 1))
+    if t.min >= args.sweep_limit * 1e9:
+      break
+
+  cls, param = fit_growth(counts, times) if len(counts) >= 3 else (None, None)
+  return make_record(tpl, engine, "ok", pumps = counts, min = [t / 1e9 for t in times],
+    timeout_at = cutoff, growth_class = cls, growth_param = float(param) if param is not None else None)
+
+# apply func to each item on a pool of worker processes, yielding the results in input order; at
+# most 2 * jobs items are in flight at any time so that the input can be consumed lazily. items for
+# which cached() returns a result are not submitted, that result is yielded in their place
+def ordered_map(func, items, jobs, cached = lambda *item: None):
+  with concurrent.futures.ProcessPoolExecutor(max_workers = jobs) as pool:
+    pending = collections.deque()
+    for item in items:
+      rec = cached(*item)
+      if rec is not None:
+        future = concurrent.futures.Future()
+        future.set_result(rec)
+      else:
+        future = pool.submit(func, *item)
+      pending.append(future)
+      if len(pending) >= 2 * jobs:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+# table row formatting, one function per mode
+def fmt_secs(v):
+  return "{0:.3e}".format(v)
+
+def fmt_pair(v):
+  return "({0:s},{1:s})".format(fmt_secs(v[0]), fmt_secs(v[1]))
+
+def profile_row(rec):
+  if rec["status"] in ("skipped", "error"):
+    return output_format.format(rec["index"], "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", rec["notes"])
+  pumps = "({0:d},{1:d})".format(*rec["pumps"])
+  if rec["status"] == "timeout":
+    return output_format.format(rec["index"], pumps, "TIMEOUT@{0:d}".format(rec["timeout_at"]), "N/A", "N/A", "N/A",
+      rec["verdict"], rec["notes"])
+  return output_format.format(rec["index"], pumps, fmt_pair(rec["median"]), fmt_pair(rec["min"]), fmt_pair(rec["iqr"]),
+    "{0:.1f}%".format(rec["growth"]), rec["verdict"], rec["notes"])
+
+def stress_row(rec):
+  if rec["status"] == "error":
+    return output_format.format(rec["index"], "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", rec["notes"])
+  if rec["status"] == "timeout":
+    return output_format.format(rec["index"], rec["pumps"], "TIMEOUT@{0:d}".format(rec["timeout_at"]), "N/A", "N/A", "N/A",
+      rec["verdict"], rec["notes"])
+  gr = "{0:.1f}%".format(rec["growth"]) if rec["growth"] is not None else "N/A"
+  vd = rec["verdict"] if rec["verdict"] is not None else "N/A"
+  return output_format.format(rec["index"], rec["pumps"], fmt_secs(rec["median"]), fmt_secs(rec["min"]),
+    fmt_secs(rec["iqr"]), gr, vd, rec["notes"])
+
+def sweep_row(rec):
+  if rec["status"] in ("skipped", "error"):
+    return sweep_format.format(rec["index"], "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", rec["notes"])
+  counts = rec["pumps"]
+  pumps = "{0:d}..{1:d}".format(counts[0], counts[-1]) if counts else "N/A"
+  cutoff = "TIMEOUT@{0:d}".format(rec["timeout_at"]) if rec["timeout_at"] is not None else ""
+  if rec["growth_class"] is None:
+    return sweep_format.format(rec["index"], pumps, len(counts), "N/A", "N/A", cutoff, "N/A", rec["notes"])
+  if rec["growth_class"] == "EXP":
+    param = "b={0:.3f}".format(rec["growth_param"])
+  else:
+    param = "d={0:.2f}".format(rec["growth_param"])
+  return sweep_format.format(rec["index"], pumps, len(counts), rec["growth_class"], param, cutoff,
+    fmt_secs(rec["min"][-1]), rec["notes"])
+
+table_rows = {"profile" : profile_row, "stress" : stress_row, "sweep" : sweep_row}
+
+# print the heading of a table, only the table format has one
+def write_heading(fmt, mode, heading):
+  if fmt != "table":
+    return
+  if mode == "sweep":
+    print("{0:^98}".format(heading))
+    print(sweep_hline)
+    print(sweep_header_format.format("ID", "PUMPS", "POINTS", "CLASS", "PARAM", "CUTOFF", "MAX (s)", "NOTES"))
+    print(sweep_hline)
+  else:
+    print("{0:^140}".format(heading))
+    print(hline)
+    print(header_format.format("ID", "PUMPS", "MEDIAN (s)", "MIN (s)", "IQR (s)", "GROWTH", "VERDICT", "NOTES"))
+    print(hline)
+
+# json has no infinity, an unbounded growth is written as null
+def json_record(rec):
+  return json.dumps(dict((k, None if isinstance(v, float) and v == float("inf") else v) for k, v in rec.items()))
+
+def csv_value(v):
+  if isinstance(v, list):
+    return ";".join(str(x) for x in v)
+  return "" if v is None else v
+
+# print a single record as soon as it is available; first tells whether any record was written
+# before (json needs a separator, csv a header)
+def write_record(fmt, mode, rec, first):
+  if fmt == "table":
+    print(table_rows[mode](rec), flush = True)
+  elif fmt == "ndjson":
+    print(json_record(rec), flush = True)
+  elif fmt == "json":
+    print(("  " if first else ", ") + json_record(rec), flush = True)
+  else:
+    w = csv.DictWriter(sys.stdout, fieldnames = csv_fields, lineterminator = "\n")
+    if first:
+      w.writeheader()
+    w.writerow(dict((k, csv_value(v)) for k, v in rec.items()))
+    sys.stdout.flush()
+
+# measurement parameters a result depends on (besides the entry and the engine): the pump-counts, how each
+# measurement is sampled and the timeout ("per-match" since it stopped bounding whole measurements); --stress
+# results are never stored
+def store_params(tpl, args):
+  sampling = [args.repeat, min_sample_ns, max_sample_loops, "per-match", args.timeout]
+  if args.sweep:
+    return ["sweep", args.base, args.sweep_ratio, args.sweep_max, args.sweep_limit] + sampling
+  return ["profile", args.base + tpl["n"]] + sampling
+
+# yield the result records of the cases, in input order
+def run_cases(func, cases, args, engine, results):
+  if results is not None:
+    return stored_cases(func, cases, args, engine, results)
+  if args.jobs > 1:
+    return ordered_map(func, ((tpl, args, engine) for tpl in cases), args.jobs)
+  return (func(tpl, args, engine) for tpl in cases)
+
+# same as run_cases but fresh results are taken from the store and everything that had to be
+# measured is saved back
+def stored_cases(func, cases, args, engine, results):
+  version = engine_version(engine)
+  ttl = args.ttl * 24 * 60 * 60
+  # keys of the cases looked up so far but not yet yielded, cached() is called once per case and in order
+  keys = collections.deque()
+
+  # stored records are re-labelled, the same entry may appear under another index or with other notes
+  def cached(tpl, args, engine):
+    keys.append(store.case_key(tpl, store_params(tpl, args), engine, version))
+    if skipped(tpl, args.timeout):
+      return None
+    rec = store.lookup(results, keys[-1], ttl)
+    if rec is None:
+      return None
+    rec["index"] = tpl["index"]
+    rec["notes"] = tpl["notes"] if "notes" in tpl else ""
+    rec["cached"] = True
+    return rec
+
+  def measured(tpl, args, engine):
+    rec = cached(tpl, args, engine)
+    return rec if rec is not None else func(tpl, args, engine)
+
+  if args.jobs > 1:
+    recs = ordered_map(func, ((tpl, args, engine) for tpl in cases), args.jobs, cached)
+  else:
+    recs = (measured(tpl, args, engine) for tpl in cases)
+  for rec in recs:
+    key = keys.popleft()
+    if not rec.pop("cached", False) and rec["status"] != "skipped":
+      store.save(results, key, rec)
+    yield rec
+
+def validate(title, suite):
+  args = parse_args()
+  results = store.open_store(args.store) if args.store is not None else None
+  first = True
+  if args.format == "json":
+    print("[", flush = True)
+  for engine in args.engine:
+    # one table per engine, the log is re-read each time instead of being kept in memory
+    cases = scanlog.load(args.log, args.pumps) if args.log is not None else suite
+    heading = "=[{0:s} / {1:s} {2:s}]=".format(title, engine, engine_version(engine))
+    if args.sweep:
+      mode = "sweep"
+      cases = (tpl for tpl in cases if args.stress in ("", tpl["index"]))
+      records = run_cases(sweep, cases, args, engine, results)
+    elif args.stress != "":
+      mode = "stress"
+      records = (rec for tpl in cases if args.stress == tpl["index"] for rec in stress(tpl, args, engine))
+    else:
+      mode = "profile"
+      records = run_cases(profile, cases, args, engine, results)
+
+    write_heading(args.format, mode, heading)
+    for rec in records:
+      write_record(args.format, mode, rec, first)
+      first = False
+  if args.format == "json":
+    print("]", flush = True)
+  if results is not None:
+    store.close_store(results)
@@ -0,0 +1,89 @@
+#!/bin/python
+
+# Streaming reader for RXXR result logs (scan.bin -i <file>), yields validation
+# cases in the same format as the hand-written suites of the validate scripts.
+
+import re
+
+
+# Word.print_select emits characters outside [\x20-\x7e] as \xHH and everything
+# else (including the backslash itself) verbatim, so \xHH is the only escape
+escape_re = re.compile(r"\\x([0-9a-fA-F]{2})")
+
+# record header, e.g. "= [24] ="
+header_re = re.compile(r"^= \[(\d+)\] =$")
+
+# pattern modifiers understood by python, everything else (snort specific) is ignored
+mod_flags = {
+  "i" : re.IGNORECASE,
+  "m" : re.MULTILINE,
+  "s" : re.DOTALL,
+  "x" : re.VERBOSE
+}
+
+# decode a word printed by Word.print_select; note that a literal backslash followed by
+# "xHH" in the original word cannot be told apart from an escape
+def decode_word(s):
+  return escape_re.sub(lambda m: chr(int(m.group(1), 16)), s)
+
+# split an INPUT line of the form [/]REGEX[/MODS] into a python expression and flags
+def split_pattern(s):
+  if len(s) > 1 and s[0] == "/" and s.rfind("/") > 0:
+    i = s.rfind("/")
+    flags = 0
+    for c in s[i + 1:]:
+      flags |= mod_flags.get(c, 0)
+    return (s[1:i], flags)
+  return (s, 0)
+
+# turn a parsed record into a validation case, None if the record is not a vulnerability
+def make_case(rec, n):
+  if not rec.get("vulnerable", "").startswith("YES") or "suffix" not in rec:
+    return None
+  exp, flags = split_pattern(rec["input"])
+  tpl = {
+    "index"    : rec["index"],
+    "exp"      : exp,
+    "flags"    : flags,
+    "prefix"   : decode_word(rec["prefix"]),
+    "pumpable" : decode_word(rec["pumpable"]),
+    "suffix"   : decode_word(rec["suffix"]),
+    "n"        : n
+  }
+  # carry over the analyser flags, e.g. {PRUNED}
+  analysis = rec["vulnerable"][3:].strip()
+  if analysis not in ("", "{}"):
+    tpl["notes"] = analysis
+  return tpl
+
+# lazily yield a validation case (using n pumps) for each vulnerable record in the log
+def read_cases(f, n):
+  rec = None
+  for line in f:
+    line = line.rstrip("\r\n")
+    m = header_re.match(line)
+    if m:
+      tpl = make_case(rec, n) if rec is not None else None
+      if tpl is not None:
+        yield tpl
+      rec = {"index" : m.group(1)}
+      continue
+    if rec is None or ":" not in line:
+      continue
+    # "KEY: value", the space is missing when a trailing-whitespace trimmer got to the log
+    key, sep, value = line.partition(":")
+    value = value[1:] if value.startswith(" ") else value
+    if key == "PUMPABLE":
+      # the first PUMPABLE line is the YES / NO answer, the second one (after PREFIX) is the word
+      key = "pumpable" if "prefix" in rec else "pumpable?"
+    else:
+      key = key.lower()
+    rec[key] = value
+  tpl = make_case(rec, n) if rec is not None else None
+  if tpl is not None:
+    yield tpl
+
+def load(fname, n):
+  with open(fname) as f:
+    for tpl in read_cases(f, n):
+      yield tpl
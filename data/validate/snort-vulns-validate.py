@@ -1,8 +1,7 @@
 #!/bin/python
 
 import re
-import time
-import argparse
+import harness
 
 
 snort_suite = [
@@ -335,89 +334,6 @@ snort_suite = [
   },
 ]
 
-# format strings (for the table)
-output_format = "{0:>5}|{1:>10}|{2:>30}|{3:>10}|{4:<30}|"
-header_format = "{0:^5}|{1:^10}|{2:^30}|{3:^10}|{4:^30}|"
-hline = "-".rjust(90, "-")
-
-# parse command-line arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("--base", help="base pump-count to use (default is 0)", type = int, default = 0)
-parser.add_argument("--stress", help="stress-test the specified vulnerability", default = "")
-args = parser.parse_args()
-base_pumps = args.base
-stress_id = args.stress
-
-# profiling function
-def profile(tpl):
-  if "skip" in tpl:
-    print output_format.format(tpl["index"], "N/A", "N/A", "N/A", tpl["notes"] if "notes" in tpl else "")
-    return
-
-  n = base_pumps + tpl["n"]
-  pumping1 = ""
-  pumping2 = ""
-  for i in range(0, n):
-    pumping1 = "{0:s}{1:s}".format(pumping1, tpl["pumpable"])
-  pumping2 = "{0:s}{1:s}".format(pumping1, tpl["pumpable"])
-
-  atk1 = "{0:s}{1:s}{2:s}".format(tpl["prefix"], pumping1, tpl["suffix"])
-  atk2 = "{0:s}{1:s}{2:s}".format(tpl["prefix"], pumping2, tpl["suffix"])
-
-  flags = tpl["flags"] if "flags" in tpl else 0
-  p = re.compile(tpl["exp"], flags)
-
-  ts1 = time.time()
-  m1 = p.match(atk1)
-  te1 = time.time()
-  
-  ts2 = time.time()
-  m2 = p.match(atk2)
-  te2 = time.time()
-
-  t1 = (te1 - ts1)
-  t2 = (te2 - ts2)
-  gr = ((t2 - t1) / t1) * 100
-
-  pumps = "({0:d},{1:d})".format(n, n + 1)
-  times = "({0:.10f},{1:.10f})".format(t1, t2)
-  growth = "{0:.1f}%".format(gr)
-  print output_format.format(tpl["index"], pumps, times, growth, tpl["notes"] if "notes" in tpl else "")
-
-# stress testing function
-def stress(tpl):
-  if "skip" in tpl:
-    return
-
-  pumping = tpl["pumpable"]
-  atk = "{0:s}{1:s}{2:s}".format(tpl["prefix"], pumping, tpl["suffix"])
-
-  flags = tpl["flags"] if "flags" in tpl else 0
-  p = re.compile(tpl["exp"], flags)
-
-  tprev = 0.0
-
-  # 20 iterations should be enough
-  for i in range(1, 21):
-    ts = time.time()
-    m = p.match(atk)
-    te = time.time()
-    gr = (((te - ts) - tprev) / tprev) * 100 if tprev != 0.0 else 0.0
-    print output_format.format(tpl["index"], i, (te - ts), "{0:.1f}%".format(gr), tpl["notes"] if "notes" in tpl else "")
-    tprev = te - ts
-    pumping = "{0:s}{1:s}".format(pumping, tpl["pumpable"])
-    atk = "{0:s}{1:s}{2:s}".format(tpl["prefix"], pumping, tpl["suffix"])
-
-def validate_snort():
-  print "{0:^90}".format("=[SNORT]=")
-  print hline
-  print header_format.format("ID", "PUMPS", "TIMES", "GROWTH", "NOTES")
-  print hline
-  for tpl in snort_suite:
-    if (stress_id == ""):
-      profile(tpl)
-    elif (stress_id == tpl["index"]):
-      stress(tpl)
-
 # main
-validate_snort()
+if __name__ == "__main__":
+  harness.validate("SNORT", snort_suite)
@@ -0,0 +1,46 @@
+#!/bin/python
+
+# Local SQLite store for validation results, so that re-runs only re-measure the
+# entries that are new, changed or older than the TTL.
+
+import json
+import time
+import sqlite3
+import hashlib
+
+
+schema = "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, record TEXT NOT NULL, stamp REAL NOT NULL)"
+
+# number of saved results between two commits
+commit_every = 64
+
+# hash of everything a result depends on: the entry itself, the measurement parameters (pump-counts,
+# repeat, sampling and timeout, see harness.store_params) and the engine along with its version
+def case_key(tpl, params, engine, version):
+  fields = [tpl["exp"], tpl.get("flags", 0), tpl["prefix"], tpl["pumpable"], tpl["suffix"], params, engine, version]
+  return hashlib.sha256(json.dumps(fields).encode("ascii")).hexdigest()
+
+def open_store(fname):
+  conn = sqlite3.connect(fname)
+  conn.execute(schema)
+  conn.commit()
+  return {"conn" : conn, "dirty" : 0}
+
+# the stored record of key, None if there is none or it is older than ttl seconds
+def lookup(store, key, ttl):
+  row = store["conn"].execute("SELECT record, stamp FROM results WHERE key = ?", (key,)).fetchone()
+  if row is None or time.time() - row[1] > ttl:
+    return None
+  return json.loads(row[0])
+
+def save(store, key, rec):
+  store["conn"].execute("INSERT OR REPLACE INTO results (key, record, stamp) VALUES (?, ?, ?)",
+    (key, json.dumps(rec), time.time()))
+  store["dirty"] += 1
+  if store["dirty"] >= commit_every:
+    store["conn"].commit()
+    store["dirty"] = 0
+
+def close_store(store):
+  store["conn"].commit()
+  store["conn"].close()